@@ -0,0 +1,61 @@
+import time
+import random
+import argparse
+
+from utils.result_set import ResultSet
+from utils.vector import Vector
+
+PAIRWISE_MAX_SIZE = 2048
+
+
+def random_vectors(size, dimensions, front_share):
+    vectors = []
+    for _ in range(size):
+        if random.random() < front_share:
+            # points spread on a plane so most of them are non-dominated
+            values = [random.random() for _ in range(dimensions - 1)]
+            values.append(dimensions - 1 - sum(values))
+        else:
+            values = [random.random() * dimensions for _ in range(dimensions)]
+        vectors.append(Vector(*(round(value * 1000) for value in values)))
+    return vectors
+
+
+def time_filter(vectors, method, repeats):
+    best = None
+    for _ in range(repeats):
+        result_set = ResultSet(vectors, pareto=method)
+        start_time = time.perf_counter()
+        result_set.remove_dominated()
+        elapsed = time.perf_counter() - start_time
+        best = elapsed if best is None else min(best, elapsed)
+    return best, len(result_set)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Pareto filter micro-benchmark')
+    parser.add_argument('-s', '--sizes', default='8,32,128,512,2048,8192')
+    parser.add_argument('-d', '--dimensions', default='2,3')
+    parser.add_argument('-f', '--front-share', type=float, default=0.5)
+    parser.add_argument('-r', '--repeats', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    print('{:>4} {:>6} {:>6} {:>12} {:>12} {:>12}'.format('d', 'size', 'front', 'pairwise', 'sweep', 'block'))
+    for dimensions in map(int, args.dimensions.split(',')):
+        for size in map(int, args.sizes.split(',')):
+            vectors = random_vectors(size, dimensions, args.front_share)
+            timings = []
+            front = None
+            for method in ('pairwise', 'sweep', 'block'):
+                if method == 'pairwise' and size > PAIRWISE_MAX_SIZE or method == 'sweep' and dimensions != 2:
+                    timings.append('-')
+                    continue
+                elapsed, front = time_filter(vectors, method, args.repeats)
+                timings.append('{:.6f}s'.format(elapsed))
+            print('{:>4} {:>6} {:>6} {:>12} {:>12} {:>12}'.format(dimensions, size, front, *timings))
+
+
+if __name__ == '__main__':
+    main()
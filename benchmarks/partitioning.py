@@ -0,0 +1,62 @@
+import io
+import os
+import time
+import argparse
+import contextlib
+
+from minibucket.heuristics import MiniBucket, get_variables_order
+from minibucket.partitioning import STRATEGIES
+from solvers.branchandbound import BranchAndBound
+from utils.graph import read_graph, vertex_cover_cost
+
+INSTANCES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'instances', 'bi-objective')
+
+
+def run(instance, max_variables, strategy, search):
+    graph = read_graph(os.path.join(INSTANCES_DIR, instance))
+    order = get_variables_order(graph)
+    solver = MiniBucket(order, max_variables, vertex_cover_cost, debug=False, partitioning=strategy)
+    start_time = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        solver.build_buckets()
+    build_time = time.perf_counter() - start_time
+
+    # one heuristic message per mini-bucket, and the ideal point of the bound at the root
+    messages = sum(len(bucket['heuristics']) for bucket in solver.buckets.values())
+    root, _ = solver.compute_cost([])
+    bound = tuple(min(vector[count] for vector in root) for count in range(solver.dimensions))
+
+    visited = search_time = None
+    if search:
+        branch_and_bound = BranchAndBound(solver, len(order))
+        start_time = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            branch_and_bound.run()
+        search_time = time.perf_counter() - start_time
+        visited = branch_and_bound.visited
+    return build_time, messages, bound, visited, search_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Mini-bucket partitioning benchmark')
+    parser.add_argument('-i', '--instances', default='n30_ep0.5_d2,n30_ep0.8_d2,n100_ep0.5_d2,n100_ep0.8_d2')
+    parser.add_argument('-mbe', '--maxvars', default='4,8')
+    parser.add_argument('-s', '--strategies', default=','.join(STRATEGIES))
+    parser.add_argument('--search', action='store_true', help='also run branch and bound with every heuristic')
+    args = parser.parse_args()
+
+    print('{:>14} {:>4} {:>8} {:>9} {:>9} {:>22} {:>9} {:>9}'.format(
+        'instance', 'mbe', 'strategy', 'build', 'messages', 'root bound', 'visited', 'search'))
+    for instance in args.instances.split(','):
+        for max_variables in map(int, args.maxvars.split(',')):
+            for strategy in args.strategies.split(','):
+                build_time, messages, bound, visited, search_time = run(instance, max_variables, strategy,
+                                                                        args.search)
+                print('{:>14} {:>4} {:>8} {:>8.3f}s {:>9} {:>22} {:>9} {:>9}'.format(
+                    instance, max_variables, strategy, build_time, messages,
+                    ', '.join('{:.1f}'.format(value) for value in bound), '-' if visited is None else visited,
+                    '-' if search_time is None else '{:.3f}s'.format(search_time)))
+
+
+if __name__ == '__main__':
+    main()
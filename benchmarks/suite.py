@@ -0,0 +1,280 @@
+import io
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import resource
+import contextlib
+import multiprocessing
+
+import numpy as np
+
+from benchmarks.pareto import random_vectors
+from minibucket.heuristics import MiniBucket, get_variables_order
+from solvers.branchandbound import BranchAndBound
+from solvers.genetic import NSGA2
+from utils.graph import read_graph, vertex_cover_cost
+from utils.instrumentation import metrics
+from utils.result_set import ResultSet
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+BASELINE = os.path.join(ROOT, 'benchmarks', 'baseline.json')
+
+# a few instances of every bundled family, small enough for the whole suite to run in about a minute
+FAMILIES = {
+    'mono': ('instances/mono-objective', ['n10_ep0.5_d1', 'n30_ep0.5_d1']),
+    'bi': ('instances/bi-objective', ['n30_ep0.5_d2', 'n30_ep0.8_d2']),
+    'inputs': ('inputs', ['test2.txt', 'graph2.txt']),
+}
+
+PREFIX_QUERIES = 500
+FULL_ASSIGNMENTS = 2000
+GENERATIONS = 20
+MICRO_SIZE = 512
+MICRO_OPERATIONS = 20000
+
+
+def quiet():
+    return contextlib.redirect_stdout(io.StringIO())
+
+
+def build(path, max_variables):
+    order = get_variables_order(read_graph(path))
+    solver = MiniBucket(order, max_variables, vertex_cover_cost, debug=False)
+    with quiet():
+        solver.build_buckets()
+    return order, solver
+
+
+def random_assignments(count, length):
+    return [[random.randint(0, 1) for _ in range(length)] for _ in range(count)]
+
+
+# solver cases, each returning the time of the measured operation and counts of the work it did
+
+def bench_build(path, max_variables):
+    order = get_variables_order(read_graph(path))
+    solver = MiniBucket(order, max_variables, vertex_cover_cost, debug=False)
+    start_time = time.perf_counter()
+    with quiet():
+        solver.build_buckets()
+    elapsed = time.perf_counter() - start_time
+    heuristics = [table for bucket in solver.buckets.values() for table in bucket['heuristics']]
+    return elapsed, {'messages': len(heuristics), 'rows': sum(len(table.points) for table in heuristics)}
+
+
+def bench_heuristic(path, max_variables):
+    order, solver = build(path, max_variables)
+    prefixes = [assignment[:random.randint(0, len(order) - 1)]
+                for assignment in random_assignments(PREFIX_QUERIES, len(order))]
+    start_time = time.perf_counter()
+    vectors = 0
+    for prefix in prefixes:
+        cost, _ = solver.compute_cost(prefix)
+        vectors += len(cost)
+    elapsed = time.perf_counter() - start_time
+    return elapsed, {'queries': len(prefixes), 'vectors': vectors}
+
+
+def bench_full_cost(path, max_variables):
+    order, solver = build(path, max_variables)
+    assignments = random_assignments(FULL_ASSIGNMENTS, len(order))
+    start_time = time.perf_counter()
+    feasible, _ = solver.compute_costs(assignments)
+    elapsed = time.perf_counter() - start_time
+    return elapsed, {'assignments': len(assignments), 'feasible': int(feasible.sum())}
+
+
+def bench_bb(path, max_variables):
+    order, solver = build(path, max_variables)
+    branch_and_bound = BranchAndBound(solver, len(order))
+    start_time = time.perf_counter()
+    with quiet():
+        pareto_front = branch_and_bound.run()
+    elapsed = time.perf_counter() - start_time
+    return elapsed, {'visited': branch_and_bound.visited, 'front': len(pareto_front)}
+
+
+def bench_nsga2(path, max_variables):
+    order, solver = build(path, max_variables)
+    genetic = NSGA2(order, solver, generations=GENERATIONS)
+    start_time = time.perf_counter()
+    with quiet():
+        genetic.run()
+    elapsed = time.perf_counter() - start_time
+    return elapsed, {'generations': GENERATIONS, 'population': len(genetic.this_population)}
+
+
+# micro-benchmarks of the value types and table operations
+
+def bench_vector(path, max_variables):
+    # cost vectors of random sets of up to max_variables nodes of the instance, added through its weights
+    # like the entries of cost tables
+    weights = read_graph(path).weights
+    nodes = range(len(weights.nodes))
+    vectors = [weights.vector(sum(1 << index for index in random.sample(nodes, min(len(nodes), max_variables))))
+               for _ in range(MICRO_SIZE)]
+    pairs = [(random.choice(vectors), random.choice(vectors)) for _ in range(MICRO_OPERATIONS)]
+    start_time = time.perf_counter()
+    dominated = 0
+    for first, second in pairs:
+        first + second
+        dominated += first <= second
+    elapsed = time.perf_counter() - start_time
+    return elapsed, {'operations': len(pairs), 'dominated': dominated}
+
+
+def bench_result_set(path, max_variables):
+    vectors = random_vectors(MICRO_SIZE, 2, 0.5)
+    others = ResultSet(random_vectors(MICRO_SIZE // 8, 2, 0.5))
+    start_time = time.perf_counter()
+    result_set = ResultSet(vectors)
+    result_set.remove_dominated()
+    joined = result_set + others
+    dominates = others > result_set
+    elapsed = time.perf_counter() - start_time
+    return elapsed, {'front': len(result_set), 'joined': len(joined), 'dominates': int(dominates)}
+
+
+def bench_tables(path, max_variables):
+    # sum and eliminate the largest mini-bucket of the instance again, the way the build does
+    order, solver = build(path, max_variables)
+    largest = None
+    for node, bucket in solver.buckets.items():
+        for minibucket in solver.get_minibuckets(bucket['costs'] + bucket['heuristics'], max_variables):
+            headers = set(header for table in minibucket for header in table.headers)
+            if node in headers and len(headers) > 1 and (largest is None or len(headers) > len(largest[1])):
+                largest = node, headers, minibucket
+    node, headers, minibucket = largest
+    start_time = time.perf_counter()
+    table = solver.create_cost_table(headers)
+    for function in minibucket:
+        solver.add_tables(table, function)
+    reduced = solver.eliminate_variable(table, node)
+    elapsed = time.perf_counter() - start_time
+    return elapsed, {'variables': len(headers), 'functions': len(minibucket), 'rows': len(reduced.points)}
+
+
+SOLVER_CASES = {
+    'build': bench_build,
+    'heuristic': bench_heuristic,
+    'full_cost': bench_full_cost,
+    'bb': bench_bb,
+    'nsga2': bench_nsga2,
+}
+MICRO_CASES = {
+    'vector': bench_vector,
+    'result_set': bench_result_set,
+    'tables': bench_tables,
+}
+
+
+def run_case(case, path, max_variables, seed, repeats):
+    # runs in its own forked process so the peak resident size is the one of this case only
+    function = SOLVER_CASES.get(case) or MICRO_CASES[case]
+    timings = []
+    for _ in range(repeats):
+        random.seed(seed)
+        np.random.seed(seed)
+        elapsed, counts = function(path, max_variables)
+        timings.append(elapsed)
+
+    # operation counts come from one more instrumented run, so the timings above pay nothing for them
+    random.seed(seed)
+    np.random.seed(seed)
+    metrics.reset()
+    metrics.enable()
+    try:
+        _, counts = function(path, max_variables)
+    finally:
+        metrics.enable(False)
+    counts = dict(counts)
+    counts.update(metrics.counters)
+    counts.update({name: sum(histogram.values()) for name, histogram in metrics.histograms.items()})
+    counts.update({name + '.calls': calls for name, (calls, _, _) in metrics.timings.items()})
+    return {'time': min(timings), 'rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, 'counts': counts}
+
+
+def run_suite(cases, families, max_variables, seed, repeats):
+    context = multiprocessing.get_context('fork')
+    results = {}
+    for case in cases:
+        if case == 'result_set':
+            targets = [('-', None)]
+        else:
+            targets = [(instance, os.path.join(ROOT, directory, instance))
+                       for directory, instances in (FAMILIES[family] for family in families)
+                       for instance in instances]
+        for instance, path in targets:
+            name = '{}/{}/mbe{}'.format(case, instance, max_variables)
+            with context.Pool(1, maxtasksperchild=1) as pool:
+                results[name] = pool.apply(run_case, (case, path, max_variables, seed, repeats))
+            print('{:<40} {:>9.4f}s {:>8.1f}MB'.format(name, results[name]['time'], results[name]['rss'] / 1024))
+            sys.stdout.flush()
+    return results
+
+
+def compare(results, baseline, time_threshold, memory_threshold, time_floor):
+    # a case regresses when it is slower or larger than allowed, or when it does different work than the
+    # baseline, in which case its timings are not comparable
+    regressions = []
+    print('\n{:<40} {:>10} {:>10} {:>8} {:>8}  {}'.format('case', 'time', 'baseline', 'ratio', 'rss', 'status'))
+    for name, result in results.items():
+        reference = baseline.get(name)
+        if reference is None:
+            print('{:<40} {:>9.4f}s {:>10} {:>8} {:>8}  new'.format(name, result['time'], '-', '-', '-'))
+            continue
+        status = []
+        if result['time'] > reference['time'] * (1 + time_threshold) and \
+                result['time'] - reference['time'] > time_floor:
+            status.append('slower')
+        if result['rss'] > reference['rss'] * (1 + memory_threshold):
+            status.append('memory')
+        changed = sorted(key for key in set(result['counts']) | set(reference['counts'])
+                         if result['counts'].get(key) != reference['counts'].get(key))
+        if changed:
+            status.append('counts ({})'.format(', '.join(changed)))
+        if status:
+            regressions.append(name)
+        print('{:<40} {:>9.4f}s {:>9.4f}s {:>8.2f} {:>8.2f}  {}'.format(
+            name, result['time'], reference['time'], result['time'] / max(reference['time'], 1e-9),
+            result['rss'] / max(reference['rss'], 1), ', '.join(status) or 'ok'))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark suite over the bundled instances')
+    parser.add_argument('-c', '--cases', default=','.join(list(SOLVER_CASES) + list(MICRO_CASES)))
+    parser.add_argument('-f', '--families', default=','.join(FAMILIES))
+    parser.add_argument('-mbe', '--maxvars', type=int, default=8)
+    parser.add_argument('-r', '--repeats', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--save', action='store_true', help='store the results as the new baseline')
+    parser.add_argument('--time-threshold', type=float, default=0.25, help='allowed relative slowdown')
+    parser.add_argument('--memory-threshold', type=float, default=0.2, help='allowed relative peak memory growth')
+    parser.add_argument('--time-floor', type=float, default=0.01, help='slowdowns below these seconds are noise')
+    args = parser.parse_args()
+
+    results = run_suite(args.cases.split(','), args.families.split(','), args.maxvars, args.seed, args.repeats)
+    if args.save:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=4, sort_keys=True)
+        print('\nBaseline written to {}'.format(args.baseline))
+        return
+    if not os.path.isfile(args.baseline):
+        print('\nNo baseline at {}, run with --save first'.format(args.baseline))
+        return
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, args.time_threshold, args.memory_threshold, args.time_floor)
+    if regressions:
+        print('\n{} regressions'.format(len(regressions)))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,26 +1,13 @@
 import os
 import time
-from math import inf
 
 from minibucket.heuristics import get_variables_order, MiniBucket
 from solvers.genetic import NSGA2
-from utils.graph import read_graph
-from utils.result_set import ResultSet
-from utils.vector import Vector
+from utils.graph import read_graph, vertex_cover_cost
 
 MAX_MINIBUCKET_VARIABLES = 10
 
 
-def vertex_cover_cost(first_node, second_node):
-    return {
-        'headers': [first_node, second_node],
-        0: ResultSet((Vector(*(inf for _ in range(len(first_node.cost)))),)),
-        1: ResultSet((first_node.cost,)),
-        2: ResultSet((second_node.cost,)),
-        3: ResultSet((first_node.cost + second_node.cost,)),
-    }
-
-
 def main():
     start_time = time.perf_counter()
     # input_file = 'inputs/test.txt'
@@ -36,7 +23,7 @@ def main():
     # input_file = 'inputs/graph2.txt'
     # input_file = 'inputs/medium_graph.txt'
     # input_file = 'inputs/big_graph.txt'
-    graph, original_graph = read_graph(input_file)
+    graph = read_graph(input_file)
     input_name = os.path.basename(input_file) + '_{}'.format(MAX_MINIBUCKET_VARIABLES)
 
     print('Graph:')
@@ -45,14 +32,15 @@ def main():
 
     # order = get_variables_order(graph, heuristic=None)
     # order = get_variables_order(graph, heuristic='custom', custom_order='ADBECF')
+    # order = get_variables_order(graph, heuristic='min-fill')
     order = get_variables_order(graph)
-    original_order = get_variables_order(original_graph)
 
     print('Order:')
     print(order)
     print()
 
-    solver = MiniBucket(order, original_order, MAX_MINIBUCKET_VARIABLES, vertex_cover_cost, debug=False)
+    solver = MiniBucket(order, MAX_MINIBUCKET_VARIABLES, vertex_cover_cost, debug=False)
+    print('Induced width {}, largest table {} keys\n'.format(solver.induced_width, solver.max_table_size))
     solver.build_buckets()
 
     print('Finished building minibuckets ({} max vars) in {:.3f}s\n'.format(
@@ -87,12 +75,11 @@ def genetic():
     # input_file = 'instances/bi-objective/n100_ep0.5_d2'
     # input_file = 'instances/bi-objective/n100_ep0.8_d2'
 
-    graph, original_graph = read_graph(input_file)
+    graph = read_graph(input_file)
     input_name = os.path.basename(input_file) + '_{}'.format(MAX_MINIBUCKET_VARIABLES)
 
     order = get_variables_order(graph)
-    original_order = get_variables_order(original_graph)
-    solver = MiniBucket(order, original_order, MAX_MINIBUCKET_VARIABLES, vertex_cover_cost, debug=False)
+    solver = MiniBucket(order, MAX_MINIBUCKET_VARIABLES, vertex_cover_cost, debug=False)
     solver.build_buckets()
 
     print('Finished building minibuckets ({} max vars) in {:.3f}s\n'.format(
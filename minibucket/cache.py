@@ -0,0 +1,153 @@
+import os
+import json
+import types
+import struct
+import hashlib
+import tempfile
+import functools
+
+import numpy as np
+
+from minibucket.tables import CostTable
+
+FORMAT_VERSION = 1
+ALIGNMENT = 8
+
+
+def _hash_code(code, digest):
+    # bytecode, names and constants, nested functions and comprehensions included
+    digest.update(code.co_code)
+    digest.update(repr(code.co_names).encode())
+    for constant in code.co_consts:
+        if isinstance(constant, types.CodeType):
+            _hash_code(constant, digest)
+        else:
+            digest.update(repr(constant).encode())
+
+
+def _hash_function(function, digest):
+    # everything the tables of a cost function depend on: its code, defaults and closure, the wrapped
+    # function and arguments of a partial, the class and attributes of a callable object
+    if isinstance(function, functools.partial):
+        _hash_function(function.func, digest)
+        digest.update(repr((function.args, sorted(function.keywords.items()))).encode())
+        return
+    if not hasattr(function, '__code__'):
+        digest.update('{}.{}\n'.format(type(function).__module__, type(function).__qualname__).encode())
+        digest.update(repr(sorted(getattr(function, '__dict__', {}).items())).encode())
+        call = getattr(type(function), '__call__', None)
+        if hasattr(call, '__code__'):
+            _hash_function(call, digest)
+        return
+    digest.update('{}.{}\n'.format(function.__module__, function.__qualname__).encode())
+    _hash_code(function.__code__, digest)
+    digest.update(repr((function.__defaults__, function.__kwdefaults__)).encode())
+    for cell in function.__closure__ or ():
+        digest.update(repr(cell.cell_contents).encode())
+
+
+def cache_key(solver):
+    # hash of everything the buckets are built from: graph, order, i-bound, partitioning and cost function
+    digest = hashlib.sha256()
+    digest.update('format {} i-bound {} dimensions {} partitioning {}\n'.format(
+        FORMAT_VERSION, solver.max_variables, solver.dimensions, solver.partitioning).encode())
+    _hash_function(solver.cost_function, digest)
+    for node in solver.order:
+        digest.update('{} {} {}\n'.format(node.id, solver.weights.costs[node.index],
+                                          sorted(item.id for item in node.neighbors)).encode())
+    return digest.hexdigest()
+
+
+def cache_path(solver, cache_dir):
+    return os.path.join(cache_dir, '{}.buckets'.format(cache_key(solver)))
+
+
+def _pad(size):
+    return -size % ALIGNMENT
+
+
+def save_buckets(solver, path):
+    # a json header describing every table followed by the offsets, points and members of all tables
+    tables, offsets, points, members = [], [], [], []
+    offsets_count = rows_count = 0
+    for node, bucket in solver.buckets.items():
+        for kind in ('costs', 'heuristics'):
+            for table in bucket[kind]:
+                tables.append({
+                    'bucket': node.index,
+                    'kind': kind,
+                    'headers': [item.index for item in table.headers],
+                    'source': None if table.source is None else table.source.index,
+                    'offsets': offsets_count,
+                    'rows': rows_count,
+                })
+                offsets.append(np.asarray(table.offsets, dtype='<i8'))
+                points.append(np.asarray(table.points, dtype='<f8'))
+                members.append(np.asarray(table.members, dtype=np.uint8))
+                offsets_count += len(table.offsets)
+                rows_count += len(table.points)
+
+    width = (len(solver.weights.nodes) + 7) // 8
+    blobs = [np.concatenate(offsets).tobytes(),
+             np.concatenate(points).reshape(-1, solver.dimensions).tobytes(),
+             np.concatenate(members).reshape(-1, width).tobytes()]
+    header = json.dumps({
+        'format': FORMAT_VERSION,
+        'dimensions': solver.dimensions,
+        'width': width,
+        'weights': {'costs': solver.weights.costs},
+        'sizes': [len(blob) for blob in blobs],
+        'tables': tables,
+    }).encode()
+
+    # written next to the target and renamed so concurrent readers never see a partial file
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    handle, temporary = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix='.tmp')
+    try:
+        with os.fdopen(handle, 'wb') as f:
+            f.write(struct.pack('<Q', len(header)))
+            f.write(header + b' ' * _pad(len(header)))
+            for blob in blobs:
+                f.write(blob + b'\0' * _pad(len(blob)))
+        os.chmod(temporary, 0o644)
+        os.replace(temporary, path)
+    except BaseException:
+        os.remove(temporary)
+        raise
+
+
+def load_buckets(solver, path):
+    if not os.path.isfile(path):
+        return False
+
+    data = np.memmap(path, dtype=np.uint8, mode='r')
+    header_size, = struct.unpack('<Q', data[:8].tobytes())
+    header = json.loads(data[8:8 + header_size].tobytes().decode())
+    if header['format'] != FORMAT_VERSION or header['dimensions'] != solver.dimensions:
+        return False
+
+    # views over the mapped file, nothing is copied until a table is read
+    start = 8 + header_size + _pad(header_size)
+    blobs = []
+    for size in header['sizes']:
+        blobs.append(data[start:start + size])
+        start += size + _pad(size)
+    offsets = blobs[0].view('<i8')
+    points = blobs[1].view('<f8').reshape(-1, solver.dimensions)
+    members = blobs[2].reshape(-1, header['width'])
+
+    # restore the node costs split while building
+    weights = solver.weights
+    weights.costs = [tuple(values) for values in header['weights']['costs']]
+    solver.costs = np.array(weights.costs, dtype=np.float64).reshape(-1, solver.dimensions)
+
+    solver.buckets = {node: {'costs': [], 'heuristics': []} for node in solver.reverse_order}
+    for table in header['tables']:
+        first = table['offsets']
+        table_offsets = offsets[first:first + 2 ** len(table['headers']) + 1]
+        rows = slice(table['rows'], table['rows'] + int(table_offsets[-1]))
+        source = None if table['source'] is None else weights.nodes[table['source']]
+        solver.buckets[weights.nodes[table['bucket']]][table['kind']].append(CostTable(
+            [weights.nodes[index] for index in table['headers']], table_offsets, points[rows], members[rows],
+            weights, source=source))
+    return True
@@ -0,0 +1,138 @@
+import sys
+import time
+from math import inf
+
+from utils.instrumentation import metrics
+from utils.result_set import ResultSet
+
+
+def _add(total, results):
+    return results if total is None else total + results
+
+
+def _infeasible(results):
+    return results is not None and all(item[0] == inf for item in results)
+
+
+def _level_size(total, lookups):
+    # bytes of a memoized level, the looked up results being owned by their tables
+    size = sys.getsizeof(lookups) + sum(sys.getsizeof(lookup) for lookup in lookups)
+    if total is not None:
+        size += sys.getsizeof(total) + sum(sys.getsizeof(vector) + sys.getsizeof(vector.__dict__) for vector in total)
+    return size
+
+
+def next_value(results, node):
+    # value of node in the smallest cost vector, ties broken by the included nodes so the choice never
+    # depends on the iteration order of the set
+    best = min(results, key=lambda vector: (tuple(vector), vector.mask))
+    return best.mask >> node.index & 1
+
+
+class Evaluator:
+    def __init__(self, solver):
+        self.solver = solver
+        self.order = solver.order
+        positions = {node: count for count, node in enumerate(self.order)}
+
+        # tables of each bucket; cost tables always count while heuristics only count as long as the
+        # variable they were computed from is not assigned
+        self.costs, self.heuristics = [], []
+        for node in self.order:
+            bucket = solver.buckets[node]
+            self.costs.append([table for table in bucket['costs'] if table.source is None])
+            self.heuristics.append([(table, positions[table.source])
+                                    for table in bucket['costs'] + bucket['heuristics'] if table.source is not None])
+
+        # assigned values, summed cost tables of the buckets of the first count variables and the
+        # heuristic results looked up in the bucket of each assigned variable
+        self.path = []
+        self.totals = [None]
+        self.lookups = []
+
+        # bitmask of the values of every prefix of the path; with the prefix length it keys the levels kept
+        # in the memo of the solver, shared by its evaluators
+        self.masks = [0]
+        self.memo = solver.memo
+
+        # results of each value of the next variable at the last evaluated prefix
+        self.branches = [None, None]
+
+    def __len__(self):
+        return len(self.path)
+
+    def push(self, value):
+        self.masks.append(self.masks[-1] | value << len(self.path))
+        self.path.append(value)
+
+    def pop(self):
+        self.path.pop()
+        del self.masks[len(self.path) + 1:]
+        del self.totals[len(self.path) + 1:]
+        del self.lookups[len(self.path):]
+
+    def seek(self, assignment):
+        # keep the common prefix of the current path and retract the rest
+        common = 0
+        for current, value in zip(self.path, assignment):
+            if current != value:
+                break
+            common += 1
+        while len(self.path) > common:
+            self.pop()
+        for value in assignment[common:]:
+            self.push(value)
+
+    def result(self):
+        depth = len(self.path)
+
+        # only the buckets of variables assigned since the last evaluation are looked up
+        for count in range(len(self.totals) - 1, depth):
+            key = 'level', count + 1, self.masks[count + 1]
+            level = self.memo.get(key)
+            if metrics.enabled:
+                metrics.count('evaluator.level_misses' if level is None else 'evaluator.level_hits')
+            if level is None:
+                total = self.totals[count]
+                if not _infeasible(total):
+                    for table in self.costs[count]:
+                        total = _add(total, table[table.key(self.path)])
+                        if _infeasible(total):
+                            break
+                lookups = [(source, table[table.key(self.path)]) for table, source in self.heuristics[count]]
+                level = self.memo.put(key, (total, lookups), _level_size(total, lookups))
+            self.totals.append(level[0])
+            self.lookups.append(level[1])
+
+        # add heuristics computed from variables that are not assigned yet
+        total = self.totals[depth]
+        for lookups in self.lookups:
+            for source, results in lookups:
+                if _infeasible(total):
+                    return total
+                if source >= depth:
+                    total = _add(total, results)
+        return total
+
+    def cost(self):
+        depth = len(self.path)
+        if depth == len(self.order):
+            return self.solver.compute_cost(self.path)
+        if metrics.enabled:
+            start_time = time.perf_counter()
+            result = self._cost(depth)
+            metrics.add_time('cost.partial', time.perf_counter() - start_time)
+            return result
+        return self._cost(depth)
+
+    def _cost(self, depth):
+        # try each value of the next unassigned variable
+        possible_results = ResultSet()
+        for possible_value in (0, 1):
+            self.push(possible_value)
+            self.branches[possible_value] = self.result()
+            possible_results |= self.branches[possible_value]
+            self.pop()
+
+        # check which is the next best value
+        return possible_results, next_value(possible_results, self.order[depth])
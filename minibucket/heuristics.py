@@ -1,40 +1,192 @@
+import sys
+import time
 import random
-from functools import lru_cache
+import logging
+import multiprocessing
 from math import inf
 from itertools import chain
-
+from multiprocessing.pool import ThreadPool
+
+import numpy as np
+
+from minibucket.cache import cache_path, load_buckets, save_buckets
+from minibucket.evaluator import Evaluator, next_value
+from minibucket.ordering import elimination_order, induced_width, max_table_size, predict_footprint, \
+    select_max_variables
+from minibucket.partitioning import partition
+from minibucket.tables import CostTable
+from utils.instrumentation import metrics
+from utils.memo import DEFAULT_BUDGET, Memo, prefix_key
 from utils.result_set import ResultSet
 from utils.vector import Vector
 
-DEBUG = True
+DEBUG = False
+
+# build details are logged at debug level, nothing being formatted unless that level is enabled
+logger = logging.getLogger(__name__)
+
+
+def enable_debug(stream=None):
+    # log the build on stdout without timestamps, the way it used to be printed; called by scripts wanting
+    # that output, solvers never change the logging configuration themselves
+    if not logger.hasHandlers():
+        handler = logging.StreamHandler(stream or sys.stdout)
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        logger.addHandler(handler)
+    logger.setLevel(logging.DEBUG)
+
+
+def table_rows(cost_table):
+    # lazy rows of a cost table, the bits of the key in header order and the cost vectors of the key
+    width = len(cost_table.headers)
+    for key in range(len(cost_table)):
+        yield ' '.join(reversed(format(key, 'b').zfill(width))), cost_table[key]
+
+
+def dump_table(cost_table, f):
+    # stream a cost table as text, one key per line
+    if cost_table.source is not None:
+        f.write('From: {}\n'.format(cost_table.source.id))
+    f.write(' '.join(str(node.id) for node in cost_table.headers) + ' Cost\n')
+    for bits, results in table_rows(cost_table):
+        f.write('{} {}\n'.format(bits, results))
+    f.write('\n')
+
+
+# solver inherited by the forked workers reducing minibuckets
+_solver = None
+
+
+def _pack(table):
+    return ([node.index for node in table.headers], table.offsets, table.points, table.members,
+            None if table.source is None else table.source.index)
+
+
+def _unpack(payload, weights):
+    headers, offsets, points, members, source = payload
+    return CostTable([weights.nodes[index] for index in headers], offsets, points, members, weights,
+                     source=None if source is None else weights.nodes[source])
+
+
+def _reduce(node, full_headers, minibucket, costs):
+    # same steps as MiniBucket.reduce_minibucket on the nodes of this worker, with the current node costs
+    weights = _solver.weights
+    full_table = CostTable.create([weights.nodes[index] for index in full_headers], costs, weights)
+    for payload in minibucket:
+        full_table.add(_unpack(payload, weights), costs)
+    return _pack(full_table.eliminate(weights.nodes[node]))
 
 
-def get_variables_order(graph, heuristic='min-neighbors', custom_order=None):
+def get_variables_order(graph, heuristic='min-neighbors', custom_order=None, weights=None):
     if not heuristic:
         return sorted(graph, key=lambda k: k.id)
     elif heuristic == 'min-neighbors':
         return sorted(graph, key=len, reverse=True)
-    elif heuristic == 'min-fill':
-        pass
+    elif heuristic in ('min-fill', 'min-degree', 'weighted-min-fill'):
+        return elimination_order(graph, heuristic, weights)
     elif heuristic == 'custom':
         return sorted(graph, key=lambda k: custom_order.index(k.id))
 
 
 class MiniBucket:
-    def __init__(self, order, original_order, max_variables, cost_function, debug=None):
+    def __init__(self, order, max_variables, cost_function, debug=None, memo_budget=DEFAULT_BUDGET, memo_policy='lru',
+                 partitioning='greedy', workers=1, executor='thread', memory_budget=None):
         self.order = order
-        self.original_order = original_order
         self.dimensions = len(self.order[0].cost)  # nr of objectives
         self.reverse_order = list(reversed(order))
+
+        # with a memory budget, the i-bound is the largest one predicted to fit, max_variables capping it
+        if memory_budget is not None:
+            max_variables = select_max_variables(order, memory_budget, self.dimensions, partitioning, max_variables)
+        elif max_variables is None:
+            raise ValueError('either max_variables or memory_budget is needed')
         self.max_variables = max_variables
+        self.memory_budget = memory_budget
         self.cost_function = cost_function
+        self.partitioning = partitioning
         self.buckets = {}
-        self.debug = debug if debug is not None else DEBUG
 
-    def build_buckets(self):
-        self.compute_buckets()
-        self.compute_heuristics()
-        self.print_final()
+        # the mini-buckets of a bucket are reduced on a pool of threads or forked processes when more than
+        # one worker is used
+        self.workers = workers
+        self.executor = executor
+        self.evaluator = None
+
+        # predicted size of the buckets for this order
+        self.induced_width = induced_width(order)
+        self.max_table_size = max_table_size(order, max_variables)
+
+        # node costs of the graph, left untouched, and the costs split between the mini-buckets of every
+        # node, indexed by node index
+        self.original_weights = order[0].cost.weights
+        self.weights = self.original_weights.copy()
+        self.costs = np.array(self.weights.costs, dtype=np.float64).reshape(-1, self.dimensions)
+
+        # elimination rank of every node, its position in the order
+        self.positions = {node: count for count, node in enumerate(order)}
+
+        # edges and costs of the nodes by position in a full assignment
+        positions = self.positions
+        self.edges = np.array([(positions[node], positions[neighbor]) for node in order
+                               for neighbor in node.neighbors if positions[node] <= positions[neighbor]],
+                              dtype=np.int64).reshape(-1, 2)
+        self.original_costs = np.array([tuple(node.cost) for node in order],
+                                       dtype=np.float64).reshape(-1, self.dimensions)
+        self.index_order = np.argsort([node.index for node in order], kind='stable')
+
+        # heuristic levels of the evaluators and next best values of the prefixes already seen, owned by this
+        # solver and emptied whenever the buckets are built
+        self.memo = Memo(memo_budget, memo_policy)
+        # debug output goes to the module logger, shown only where the caller enabled its debug level
+        self.debug = debug if debug is not None else DEBUG or logger.isEnabledFor(logging.DEBUG)
+
+    def build_buckets(self, cache_dir=None):
+        # buckets built before for the same instance, order and i-bound are mapped from the cache
+        path = cache_path(self, cache_dir) if cache_dir else None
+        if path is None or not load_buckets(self, path):
+            self.compute_buckets()
+            self.compute_heuristics()
+            if path is not None:
+                save_buckets(self, path)
+        self.compile_tables()
+        self.memo.clear()
+        self.evaluator = self.create_evaluator()
+        if self.debug:
+            self.print_final()
+
+    def deepen(self, time_limit, cache_dir=None):
+        # build with the current i-bound, then rebuild with the next one while its build, expected to take
+        # as much longer as its predicted footprint is larger, fits the time left and the memory budget
+        start_time = time.perf_counter()
+        self.build_buckets(cache_dir)
+        build_time = time.perf_counter() - start_time
+        footprint = predict_footprint(self.order, self.max_variables, self.dimensions, self.partitioning)
+        while self.max_variables <= self.induced_width:
+            next_footprint = predict_footprint(self.order, self.max_variables + 1, self.dimensions,
+                                               self.partitioning)
+            if self.memory_budget is not None and next_footprint > self.memory_budget:
+                break
+            expected = build_time * next_footprint / footprint
+            if time.perf_counter() - start_time + expected > time_limit:
+                break
+
+            logger.info('Deepening to i-bound %s', self.max_variables + 1)
+            self.reset_buckets(self.max_variables + 1)
+            build_start = time.perf_counter()
+            self.build_buckets(cache_dir)
+            build_time = time.perf_counter() - build_start
+            footprint = next_footprint
+        return self.max_variables
+
+    def reset_buckets(self, max_variables):
+        # drop the buckets and the node cost splits of the last build
+        self.max_variables = max_variables
+        self.max_table_size = max_table_size(self.order, max_variables)
+        self.buckets = {}
+        self.weights = self.original_weights.copy()
+        self.costs = np.array(self.weights.costs, dtype=np.float64).reshape(-1, self.dimensions)
+        self.evaluator = None
+        self.clear_caches()
 
     def compute_buckets(self):
         processed = set()
@@ -50,245 +202,209 @@ class MiniBucket:
         # add all elementary costs to this bucket
         for other_node in constraints:
             elementary_cost = self.cost_function(node, other_node)
-            elementary_costs.append(elementary_cost)
+            elementary_costs.append(CostTable.from_dict(elementary_cost, self.weights, self.dimensions))
 
         return elementary_costs
 
-    def create_cost_table(self, headers):
-        cost_table = {'headers': list(headers)}
-        for i in range(2 ** len(headers)):
-            # sum costs of chosen nodes
-            total_cost = Vector.add_vectors(
-                *(node.cost for count, node in enumerate(headers) if i & (1 << count)), dimensions=self.dimensions)
-            cost_table[i] = ResultSet((total_cost,))
-        return cost_table
-
-    @staticmethod
-    def add_tables(big_table, small_table):
-        big_headers = big_table['headers']
-        small_headers = small_table['headers']
-
-        # add small cost tables together
-        for small_key, small_value in small_table.items():
-            if small_key in {'headers', 'from'}:
-                continue
-
-            # build index, mask and common cost
-            index, mask = MiniBucket.get_index_mask_cost(small_key, small_headers, big_headers)
+    def compile_tables(self):
+        # map the headers of every bucket table to positions in the order for fast key lookups
+        for bucket in self.buckets.values():
+            for table in bucket['costs'] + bucket['heuristics']:
+                table.compile(self.positions)
 
-            # add to corresponding big table keys
-            for big_key in big_table:
-                if big_key in {'headers', 'from'}:
-                    continue
-                if big_key & mask == index:
-                    big_table[big_key] += small_value
+    def create_cost_table(self, headers):
+        # sum costs of chosen nodes for every key
+        return CostTable.create(headers, self.costs, self.weights)
 
-    @staticmethod
-    def get_index_mask_cost(key, old_headers, new_headers):
-        index = mask = 0
-        for old_count, node in enumerate(old_headers):
-            is_set = bool(key & (1 << old_count))
-            new_count = new_headers.index(node)
-            mask += 1 << new_count
-            index += is_set << new_count
-        return index, mask
+    def add_tables(self, big_table, small_table):
+        # add small cost table to every big table key sharing its assignment
+        big_table.add(small_table, self.costs)
 
     @staticmethod
-    def print_cost_table(cost_table, debug=True):
-        if not debug:
+    def print_cost_table(cost_table, debug):
+        if not debug or not logger.isEnabledFor(logging.DEBUG):
             return
-        headers = cost_table['headers']
-        headers_length = len(headers)
-        if 'from' in cost_table:
-            print('From: {}'.format(cost_table['from'].id))
-        print(' '.join(map(lambda x: str(x.id), headers)), 'Cost')
-        for i in range(2 ** headers_length):
-            print(' '.join(reversed(bin(i)[2:].zfill(headers_length))), cost_table[i])
-        print()
+        if cost_table.source is not None:
+            logger.debug('From: %s', cost_table.source.id)
+        logger.debug('%s Cost', ' '.join(str(node.id) for node in cost_table.headers))
+        for bits, results in table_rows(cost_table):
+            logger.debug('%s %s', bits, results)
+        logger.debug('')
 
     def compute_heuristics(self):
-        for node_count, node in enumerate(self.reverse_order):
-            if self.debug:
-                print('==>> Computing minibuckets for node:', node)
-
-            # add together cost and all heuristics
-            costs = self.buckets[node]['costs']
-            heuristics = self.buckets[node]['heuristics']
-            dependencies = costs + heuristics
-            if self.debug:
-                print('Dependencies count:', len(dependencies))
-                for dep in dependencies:
-                    self.print_cost_table(dep, self.debug)
-
-            # split all dependencies to minibuckets
-            minibuckets = self.get_minibuckets(dependencies, self.max_variables)
-            if self.debug:
-                print('Minibuckets count:', len(minibuckets))
-                print('Splitting node:', node)
-            node.split(len(minibuckets))
-
-            # compute next node for each minibucket's heuristic
-            ordered_minibuckets = []
-            for minibucket in minibuckets:
-                full_headers = set(chain.from_iterable((table['headers'] for table in minibucket)))
-                for next_index, next_node in enumerate(self.reverse_order[node_count + 1:]):
-                    if next_node in full_headers:
-                        ordered_minibuckets.append((next_index, minibucket))
-                        break
-            ordered_minibuckets = [item[1] for item in sorted(ordered_minibuckets, key=lambda k: k[0])]
-
-            # process each minibucket individually
-            for count, minibucket in enumerate(ordered_minibuckets):
-                if self.debug:
-                    print('Minibucket {} ({} functions):'.format(count + 1, len(minibucket)))
-                    for function in minibucket:
-                        self.print_cost_table(function, self.debug)
-                full_headers = set(chain.from_iterable((table['headers'] for table in minibucket)))
-                full_table = self.create_cost_table(full_headers)
-
-                # compute heuristic for this minibucket
-                for table in minibucket:
-                    self.add_tables(full_table, table)
-                if self.debug:
-                    print('Summed minibucket:')
-                    self.print_cost_table(full_table, self.debug)
-
-                # add heuristic to the bucket of the first constraint in the chain
-                for next_node in self.reverse_order[node_count + 1:]:
-                    if next_node in full_headers:
-                        reduced_table = self.eliminate_variable(full_table, node)
-                        if self.debug:
-                            print('Remaining reduced table:')
-                            self.print_cost_table(reduced_table, self.debug)
-                        self.buckets[next_node]['heuristics'].append(reduced_table)
-                        break
-            if self.debug:
-                print('\n')
-
-    @staticmethod
-    def get_minibuckets(tables, max_variables):
-        not_chosen = list(tables)
-        minibuckets = []
-
-        # build minibuckets as long as there are still costs not included
-        while not_chosen:
-            first_item = sorted(not_chosen, key=lambda k: len(k['headers']))[0]
-            not_chosen.remove(first_item)
-            variables = set(first_item['headers'])
-            minibucket = [first_item]
-            minibuckets.append(minibucket)
-
-            # greedily add as many dependencies as possible to this bucket
-            remaining = max_variables - len(variables)
-            while remaining >= 0 and not_chosen:
-                best_choice = MiniBucket.choose_next_function(variables, not_chosen, remaining)
-                if best_choice is None:
-                    break
-                minibucket.append(best_choice)
-                not_chosen.remove(best_choice)
-                variables.update(best_choice['headers'])
-                remaining = max_variables - len(variables)
-
-        return minibuckets
+        pool = self.create_pool()
+        try:
+            for node in self.reverse_order:
+                if not metrics.enabled:
+                    self.compute_bucket_heuristics(node, pool)
+                    continue
+                start_time = time.perf_counter()
+                self.compute_bucket_heuristics(node, pool)
+                metrics.append('buckets.build_time', {'node': node.id,
+                                                      'time': round(time.perf_counter() - start_time, 6)})
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+
+    def compute_bucket_heuristics(self, node, pool=None):
+        if self.debug:
+            logger.debug('==>> Computing minibuckets for node: %s', node)
+
+        # add together cost and all heuristics
+        costs = self.buckets[node]['costs']
+        heuristics = self.buckets[node]['heuristics']
+        dependencies = costs + heuristics
+        if self.debug:
+            logger.debug('Dependencies count: %s', len(dependencies))
+            for dep in dependencies:
+                self.print_cost_table(dep, self.debug)
+
+        # split all dependencies to minibuckets
+        minibuckets = self.get_minibuckets(dependencies, self.max_variables, self.partitioning)
+        if self.debug:
+            logger.debug('Minibuckets count: %s', len(minibuckets))
+            logger.debug('Splitting node: %s', node)
+        self.costs[node.index] = self.weights.split(node.index, len(minibuckets))
+
+        # the heuristic of each minibucket goes to the bucket of its variable eliminated next, the one with the
+        # highest rank below this node; minibuckets with no such variable send nothing
+        rank = self.positions[node]
+        routed = []
+        for minibucket in minibuckets:
+            full_headers = set(chain.from_iterable((table.headers for table in minibucket)))
+            destination = max((self.positions[item] for item in full_headers if self.positions[item] < rank),
+                              default=None)
+            if destination is not None:
+                routed.append((destination, full_headers, minibucket))
+        routed.sort(key=lambda k: -k[0])
+
+        # process each minibucket individually, adding the heuristics in order
+        if pool is None or len(routed) < 2:
+            reduced_tables = [self.reduce_minibucket(node, full_headers, minibucket, count)
+                              for count, (_, full_headers, minibucket) in enumerate(routed)]
+        elif self.executor == 'thread':
+            reduced_tables = pool.starmap(self.reduce_minibucket, [(node, full_headers, minibucket)
+                                                                   for _, full_headers, minibucket in routed])
+        else:
+            reduced_tables = [_unpack(payload, self.weights)
+                              for payload in pool.starmap(_reduce, [
+                                  (node.index, [item.index for item in full_headers],
+                                   [_pack(table) for table in minibucket], self.costs)
+                                  for _, full_headers, minibucket in routed])]
+        for (destination, full_headers, minibucket), reduced_table in zip(routed, reduced_tables):
+            self.buckets[self.order[destination]]['heuristics'].append(reduced_table)
+            if metrics.enabled:
+                metrics.append('minibuckets.tables', {'node': node.id, 'functions': len(minibucket),
+                                                      'variables': len(full_headers),
+                                                      'rows': len(reduced_table.points)})
+        if self.debug:
+            logger.debug('\n')
+
+    def create_pool(self):
+        global _solver
+        if self.workers == 1 or self.debug:
+            return None
+        if self.executor == 'thread':
+            return ThreadPool(self.workers)
+        elif self.executor == 'process':
+            # workers are forked with the nodes of this solver and get the tables of every minibucket
+            _solver = self
+            try:
+                return multiprocessing.get_context('fork').Pool(self.workers)
+            finally:
+                _solver = None
+        raise ValueError('unknown executor: {}'.format(self.executor))
+
+    def reduce_minibucket(self, node, full_headers, minibucket, count=None):
+        if self.debug:
+            logger.debug('Minibucket %s (%s functions):', count + 1, len(minibucket))
+            for function in minibucket:
+                self.print_cost_table(function, self.debug)
+        full_table = self.create_cost_table(full_headers)
+
+        # compute heuristic for this minibucket
+        for table in minibucket:
+            self.add_tables(full_table, table)
+        if self.debug:
+            logger.debug('Summed minibucket:')
+            self.print_cost_table(full_table, self.debug)
+
+        reduced_table = self.eliminate_variable(full_table, node)
+        if self.debug:
+            logger.debug('Remaining reduced table:')
+            self.print_cost_table(reduced_table, self.debug)
+        return reduced_table
 
     @staticmethod
-    def choose_next_function(variables, not_chosen, remaining_variables):
-        best_choice = None
-        max_value = -inf
-        for dependency in not_chosen:
-            headers = set(dependency['headers'])
-            common_variables = len(headers & variables)
-            new_variables = len(headers - variables)
-
-            # if not new variables are added then add to bucket
-            if not new_variables:
-                return dependency
-
-            # check not to add too many variables
-            if new_variables > remaining_variables:
-                continue
-
-            # greedily choose best rate of old to new variables
-            value = common_variables / new_variables
-            if value > max_value:
-                best_choice = dependency
-                max_value = value
-
-        return best_choice
+    def get_minibuckets(tables, max_variables, strategy='greedy'):
+        return partition(tables, max_variables, strategy)
 
     @staticmethod
     def eliminate_variable(table, node):
-        full_headers = table['headers']
-        heuristic_headers = [item for item in full_headers if item != node]
-        heuristic_table = {'headers': heuristic_headers, 'from': node}
-        heuristic_table.update({i: ResultSet() for i in range(2 ** len(heuristic_headers))})
-        if len(full_headers) == 1:
-            raise Exception('Should not happen')
-
         # populate heuristic with joint non-dominated values
-        for heuristic_key, value in heuristic_table.items():
-            if heuristic_key in {'headers', 'from'}:
-                continue
-
-            # build index and mask
-            index, mask = MiniBucket.get_index_mask_cost(heuristic_key, heuristic_headers, full_headers)
-
-            # join corresponding full table keys
-            for full_key in table:
-                if full_key in {'headers', 'from'}:
-                    continue
-                if full_key & mask == index:
-                    heuristic_table[heuristic_key] |= table[full_key]
+        return table.eliminate(node)
 
-        return heuristic_table
-
-    def print_final(self):
+    def final_table(self):
+        # every cost and heuristic of the first bucket summed, the non-dominated costs of the whole problem
         final_node = self.buckets[self.order[0]]
         all_headers = set()
         for cost in final_node['costs'] + final_node['heuristics']:
-            all_headers.update(cost['headers'])
+            all_headers.update(cost.headers)
         final_cost = self.create_cost_table(all_headers)
         for cost in final_node['costs'] + final_node['heuristics']:
             self.add_tables(final_cost, cost)
 
         # remove dominated values
-        for key, value in final_cost.items():
-            if key in {'headers', 'from'}:
-                continue
-            value.remove_dominated()
+        final_cost.remove_dominated()
+        return final_cost
+
+    def print_final(self):
+        self.print_cost_table(self.final_table(), self.debug)
 
-        self.print_cost_table(final_cost, debug=True)
+    def dump_final(self, path):
+        with open(path, 'w') as f:
+            dump_table(self.final_table(), f)
 
     # noinspection DuplicatedCode
     def compute_cost(self, assignment):
         assigned_count = len(assignment)
 
         # check if full cost or partial assignment heuristic
-        if assigned_count == len(self.original_order):
+        if assigned_count == len(self.order):
             return self._compute_cost_full(assignment)
         else:
             return self._compute_cost_partial(assignment)
 
     def _compute_cost_full(self, assignment):
-        zipped = list(zip(assignment, self.original_order))
-        total_cost = None
-        nodes_included = {node for value, node in zipped if value}
-
-        for count, (first_value, first_node) in enumerate(zipped):
-
-            # check if any hard constraints violated
-            for second_value, second_node in zipped[count:]:
-                if not first_value and not second_value:
-                    if second_node in first_node.neighbors:
-                        return ResultSet((Vector(*(inf for _ in range(self.dimensions)),
-                                                 includes=nodes_included),)), None
-
-            # add total cost from cost functions
-            if first_value:
-                total_cost = first_node.cost if total_cost is None else \
-                    total_cost + first_node.cost
-
-        return ResultSet((total_cost,)), None
+        if metrics.enabled:
+            start_time = time.perf_counter()
+            result = self._compute_cost_vector(assignment)
+            metrics.add_time('cost.full', time.perf_counter() - start_time)
+            return result
+        return self._compute_cost_vector(assignment)
+
+    def _compute_cost_vector(self, assignment):
+        feasible, costs = self.compute_costs([assignment])
+        weights = self.original_weights
+        nodes_included = sum(1 << node.index for value, node in zip(assignment, self.order) if value)
+
+        return ResultSet((Vector(*costs[0].tolist(), mask=nodes_included, weights=weights),)), None
+
+    def compute_costs(self, assignments):
+        # feasibility and cost of every full assignment in the rows of assignments, infeasible ones
+        # costing inf on every objective
+        assignments = np.asarray(assignments, dtype=bool).reshape(-1, len(self.order))
+        if metrics.enabled:
+            metrics.count('cost.batch_rows', len(assignments))
+        excluded = ~assignments
+        feasible = ~(excluded[:, self.edges[:, 0]] & excluded[:, self.edges[:, 1]]).any(axis=1)
+
+        # costs are accumulated in node index order so the sums match the ones of Weights.cost
+        columns = self.index_order
+        costs = np.add.accumulate(assignments[:, columns, None] * self.original_costs[columns][None], axis=1)[:, -1]
+        costs[~feasible] = inf
+        return feasible, costs
 
     def _compute_cost_partial_backup(self, assignment):
         assigned_count = len(assignment)
@@ -304,9 +420,9 @@ class MiniBucket:
             for node in assigned_nodes:
                 # add actual constraints and heuristics coming from unassigned nodes
                 for cost_function in self.buckets[node]['costs'] + self.buckets[node]['heuristics']:
-                    if 'from' in cost_function and cost_function['from'] in assigned_nodes:
+                    if cost_function.source in assigned_nodes:
                         continue
-                    key = self.get_assignment_table_key(this_assignment, cost_function['headers'])
+                    key = self.get_assignment_table_key(this_assignment, cost_function)
                     if not this_result:
                         this_result = cost_function[key]
                     else:
@@ -318,79 +434,34 @@ class MiniBucket:
             possible_results |= this_result
 
         # check which is the next best value
-        next_node = self.order[assigned_count]
-        for result in possible_results:
-            if next_node in result.includes:
-                return possible_results, 1
-            else:
-                return possible_results, 0
+        return possible_results, next_value(possible_results, self.order[assigned_count])
 
     def _compute_cost_partial(self, assignment):
-        assigned_count = len(assignment)
-        assigned_nodes = tuple(self.order[:assigned_count + 1])
-
-        # try each value of the next unassigned variable
-        possible_results = ResultSet()
-        for possible_value in (0, 1):
+        self.evaluator.seek(assignment)
+        return self.evaluator.cost()
 
-            this_assignment = tuple(assignment) + (possible_value,)
-            this_result = self._compute_fixed_partial(this_assignment, assigned_nodes)
+    def create_evaluator(self):
+        return Evaluator(self)
 
-            # save possible results
-            possible_results |= this_result
-
-        # check which is the next best value
-        next_node = self.order[assigned_count]
-        for result in possible_results:
-            if next_node not in result.includes:
-                return possible_results, 0
-            else:
-                return possible_results, 1
-
-    @lru_cache(maxsize=327680)
-    def _compute_fixed_partial(self, partial, full):
-        if not partial:
-            return None
-
-        assignment_length = len(partial)
-        previous_partial = partial[:-1]
-
-        this_result = self._compute_fixed_partial(previous_partial, full)
-        if this_result and all(item == tuple(inf for _ in range(self.dimensions)) for item in this_result):
-            return this_result
-
-        node = self.order[assignment_length - 1]
-        full_set = set(full)
-        for cost_function in self.buckets[node]['costs'] + self.buckets[node]['heuristics']:
-            if 'from' in cost_function and cost_function['from'] in full_set:
-                continue
-            key = self.get_assignment_table_key(partial, cost_function['headers'])
-            if not this_result:
-                this_result = cost_function[key]
-            else:
-                this_result = this_result + cost_function[key]
-            if all(item == tuple(inf for _ in range(self.dimensions)) for item in this_result):
-                return this_result
-        return this_result
-
-    def get_assignment_table_key(self, assignment, headers):
-        key = 0
-        for value, node in zip(assignment, self.order):
-            try:
-                key += value << headers.index(node)
-            except ValueError:
-                continue
-        return key
+    @staticmethod
+    def get_assignment_table_key(assignment, table):
+        return table.key(assignment)
 
     def get_best_next(self, assignment):
         assigned_count = len(assignment)
 
         # check if full cost or partial assignment heuristic
-        if assigned_count == len(self.original_order):
+        if assigned_count == len(self.order):
             return None
-        return self._next_best_assignment(tuple(assignment))
+        key = ('next',) + prefix_key(assignment)
+        best_next = self.memo.get(key)
+        if best_next is None:
+            best_next = self.memo.put(key, self._next_best_assignment(tuple(assignment)))
+        return best_next
+
+    def clear_caches(self):
+        self.memo.clear()
 
-    @lru_cache(maxsize=327680)
     def _next_best_assignment(self, assignment):
         # try each value of the next unassigned variable
         possible_results = ResultSet()
@@ -403,7 +474,7 @@ class MiniBucket:
             # add costs in this bucket
             node = self.order[this_index]
             for cost_function in self.buckets[node]['costs'] + self.buckets[node]['heuristics']:
-                key = self.get_assignment_table_key(this_assignment, cost_function['headers'])
+                key = self.get_assignment_table_key(this_assignment, cost_function)
                 if not this_result:
                     this_result = cost_function[key]
                 else:
@@ -0,0 +1,179 @@
+import heapq
+from math import inf
+
+from minibucket.partitioning import partition
+
+
+def _popcount(bits):
+    return bin(bits).count('1')
+
+
+def _bits(bits):
+    while bits:
+        low = bits & -bits
+        yield low.bit_length() - 1
+        bits ^= low
+
+
+def _adjacency(nodes):
+    # neighbors of every node as a bitset over the positions in nodes
+    positions = {node: count for count, node in enumerate(nodes)}
+    return [sum(1 << positions[item] for item in node.neighbors if item in positions) for node in nodes]
+
+
+def _weight(bits, weights):
+    if weights is None:
+        return _popcount(bits)
+    return sum(weights[position] for position in _bits(bits))
+
+
+def _fill(adjacency, position, weights):
+    # weight of the edges missing between the neighbors of position, every missing edge is seen twice
+    neighbors = adjacency[position]
+    fill = 0
+    for first in _bits(neighbors):
+        missing = neighbors & ~adjacency[first] & ~(1 << first)
+        fill += (1 if weights is None else weights[first]) * _weight(missing, weights)
+    return fill // 2 if weights is None else fill / 2
+
+
+def _update_fill(adjacency, position, remaining, scores, weights):
+    # fill changes of eliminating position, computed from the adjacency before the elimination
+    neighbors = adjacency[position]
+    changed = neighbors
+
+    # every new edge between two neighbors lowers the fill of the nodes adjacent to both of its ends
+    for first in _bits(neighbors):
+        for second in _bits(neighbors & ~adjacency[first] & ~((1 << (first + 1)) - 1)):
+            common = adjacency[first] & adjacency[second] & remaining
+            for other in _bits(common):
+                scores[other] -= 1 if weights is None else weights[first] * weights[second]
+            changed |= common
+
+    # a neighbor no longer misses the edges to the eliminated node but may miss edges from its other
+    # neighbors to the neighbors it gains
+    for neighbor in _bits(neighbors):
+        others = adjacency[neighbor] & ~neighbors & ~(1 << position)
+        scores[neighbor] -= (1 if weights is None else weights[position]) * _weight(others, weights)
+        for gained in _bits(neighbors & ~adjacency[neighbor] & ~(1 << neighbor)):
+            scores[neighbor] += (1 if weights is None else weights[gained]) * \
+                _weight(others & ~adjacency[gained], weights)
+    return changed
+
+
+def elimination_order(graph, heuristic='min-fill', weights=None):
+    # greedily eliminate the node with the lowest score in the elimination graph, ties broken by degree
+    # and then by node index; the returned order is reversed since buckets are processed last to first
+    nodes = sorted(graph, key=lambda k: k.index)
+    adjacency = _adjacency(nodes)
+    if heuristic == 'min-degree':
+        scores = [_popcount(bits) for bits in adjacency]
+    elif heuristic in ('min-fill', 'weighted-min-fill'):
+        if heuristic == 'weighted-min-fill' and weights is not None:
+            weights = [weights[node] for node in nodes]
+        else:
+            weights = None
+        scores = [_fill(adjacency, position, weights) for position in range(len(nodes))]
+    else:
+        raise ValueError('unknown elimination heuristic: {}'.format(heuristic))
+
+    # lazy heap, entries are skipped when the score or degree changed since they were pushed
+    heap = [(scores[position], _popcount(adjacency[position]), position) for position in range(len(nodes))]
+    heapq.heapify(heap)
+    remaining = (1 << len(nodes)) - 1
+    eliminated = []
+    while heap:
+        value, degree, position = heapq.heappop(heap)
+        if not remaining >> position & 1 or value != scores[position] or degree != _popcount(adjacency[position]):
+            continue
+        remaining &= ~(1 << position)
+        eliminated.append(nodes[position])
+
+        neighbors = adjacency[position]
+        changed = neighbors
+        if heuristic != 'min-degree':
+            changed = _update_fill(adjacency, position, remaining, scores, weights)
+
+        # connect the neighbors of the eliminated node and remove it from the graph
+        for neighbor in _bits(neighbors):
+            adjacency[neighbor] = (adjacency[neighbor] | neighbors) & ~(1 << neighbor) & ~(1 << position)
+            if heuristic == 'min-degree':
+                scores[neighbor] = _popcount(adjacency[neighbor])
+        for other in _bits(changed):
+            heapq.heappush(heap, (scores[other], _popcount(adjacency[other]), other))
+
+    return list(reversed(eliminated))
+
+
+def induced_width(order):
+    # largest number of earlier neighbors of a node once the later nodes are eliminated
+    adjacency = _adjacency(order)
+    width = 0
+    for position in reversed(range(len(order))):
+        parents = adjacency[position] & ((1 << position) - 1)
+        width = max(width, _popcount(parents))
+        for parent in _bits(parents):
+            adjacency[parent] |= parents & ~(1 << parent)
+    return width
+
+
+def max_table_size(order, max_variables):
+    # number of keys of the largest table built, a mini-bucket holding at most max_variables variables
+    # unless a single function has more
+    return 2 ** min(induced_width(order) + 1, max(max_variables, 2))
+
+
+# rows per key of the tables, a bit over the one the non-dominated sets mostly hold
+ROWS_PER_KEY = 1.25
+
+
+class _Scope:
+    # stands in for a cost table in a dry run of the partitioning, which only reads the headers
+    def __init__(self, headers):
+        self.headers = headers
+
+
+def predict_tables(order, max_variables, strategy='greedy'):
+    # dry run of the bucket elimination on scopes only, partitioned and routed like the build does, giving
+    # the keys of every table kept in the buckets and the keys of the largest table summed while building.
+    # content based partitioning needs the table costs, the greedy one stands in for it
+    if strategy == 'content':
+        strategy = 'greedy'
+    positions = {node: count for count, node in enumerate(order)}
+    buckets = {node: [] for node in order}
+    processed = set()
+    stored = largest = 0
+    for node in reversed(order):
+        tables = [_Scope([node, item]) for item in node if item not in processed] + buckets[node]
+        processed.add(node)
+        stored += sum(2 ** len(table.headers) for table in tables)
+        for minibucket in partition(tables, max_variables, strategy):
+            full_headers = set(header for table in minibucket for header in table.headers)
+            largest = max(largest, 2 ** len(full_headers))
+            destination = max((positions[item] for item in full_headers if positions[item] < positions[node]),
+                              default=None)
+            if destination is not None:
+                buckets[order[destination]].append(_Scope([item for item in full_headers if item != node]))
+    return stored, largest
+
+
+def predict_footprint(order, max_variables, dimensions, strategy='greedy'):
+    # bytes of the built buckets, offsets, cost vectors and packed includes of every kept table, plus the
+    # unpacked includes and copies made while summing the largest table
+    stored, largest = predict_tables(order, max_variables, strategy)
+    row = 8 * dimensions + (len(order) + 7) // 8
+    return int(stored * (8 + ROWS_PER_KEY * row) + largest * ROWS_PER_KEY * (len(order) + 3 * row + 16))
+
+
+def select_max_variables(order, memory_budget, dimensions, strategy='greedy', upper=None):
+    # largest i-bound whose predicted footprint fits the budget, the smallest one when none does; bounds
+    # over the induced width plus one build the same buckets. the footprint grows with the i-bound, so the
+    # bound is bisected between the smallest one and the first one known to be over the budget
+    best, over = 2, min(induced_width(order) + 1, upper or inf) + 1
+    while over - best > 1:
+        middle = (best + over) // 2
+        if predict_footprint(order, middle, dimensions, strategy) > memory_budget:
+            over = middle
+        else:
+            best = middle
+    return best
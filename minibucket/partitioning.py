@@ -0,0 +1,170 @@
+import heapq
+from math import inf
+
+import numpy as np
+
+STRATEGIES = ('greedy', 'scope', 'content')
+
+
+def _popcount(bits):
+    return bin(bits).count('1')
+
+
+def _bits(bits):
+    while bits:
+        low = bits & -bits
+        yield low.bit_length() - 1
+        bits ^= low
+
+
+def _scope(table):
+    # bitmask of the node indexes in the headers of a table
+    return sum(1 << node.index for node in table.headers)
+
+
+def partition(tables, max_variables, strategy='greedy'):
+    if strategy == 'greedy':
+        return greedy(tables, max_variables)
+    elif strategy == 'scope':
+        return scope_based(tables, max_variables)
+    elif strategy == 'content':
+        return content_based(tables, max_variables)
+    raise ValueError('unknown partitioning strategy: {}'.format(strategy))
+
+
+def greedy(tables, max_variables):
+    # start every mini-bucket with the smallest table left and keep adding the table with the best rate of
+    # old to new variables, tables adding no new variable first and earlier tables first on ties
+    scopes = [_scope(table) for table in tables]
+    containing = {}
+    for position, scope in enumerate(scopes):
+        for variable in _bits(scope):
+            containing.setdefault(variable, []).append(position)
+    chosen = [False] * len(tables)
+    smallest = [(len(table.headers), position) for position, table in enumerate(tables)]
+    heapq.heapify(smallest)
+
+    def rate(position):
+        new_variables = _popcount(scopes[position] & ~variables)
+        if not new_variables:
+            return -inf, new_variables
+        return -(_popcount(scopes[position] & variables) / new_variables), new_variables
+
+    minibuckets = []
+    left = len(tables)
+    while left:
+        _, first = heapq.heappop(smallest)
+        if chosen[first]:
+            continue
+        chosen[first] = True
+        left -= 1
+        variables = scopes[first]
+        minibucket = [tables[first]]
+        minibuckets.append(minibucket)
+
+        # lazy queue on the rate, an entry being stale when the rate of its table changed since
+        candidates = [(rate(position)[0], position) for position in range(len(tables)) if not chosen[position]]
+        heapq.heapify(candidates)
+        remaining = max_variables - _popcount(variables)
+        while remaining >= 0 and left:
+            best_choice = None
+            while candidates:
+                value, position = heapq.heappop(candidates)
+                if chosen[position]:
+                    continue
+                current, new_variables = rate(position)
+                if current != value:
+                    continue
+
+                # new variables of a table only drop when it gets requeued, and remaining never grows
+                if new_variables <= remaining:
+                    best_choice = position
+                    break
+            if best_choice is None:
+                break
+
+            chosen[best_choice] = True
+            left -= 1
+            minibucket.append(tables[best_choice])
+            added = scopes[best_choice] & ~variables
+            variables |= scopes[best_choice]
+            remaining = max_variables - _popcount(variables)
+
+            # only tables sharing an added variable change their rate
+            changed = set()
+            for variable in _bits(added):
+                changed.update(position for position in containing[variable] if not chosen[position])
+            for position in changed:
+                heapq.heappush(candidates, (rate(position)[0], position))
+
+    return minibuckets
+
+
+def _first_fit(tables, scopes, order, max_variables, choose, opened=None):
+    # place tables in the given order into the mini-bucket picked by choose among the ones they fit in,
+    # opening a new one when they fit nowhere
+    minibuckets, variables = [], []
+    for position in order:
+        fitting = [count for count, bucket_variables in enumerate(variables)
+                   if _popcount(bucket_variables | scopes[position]) <= max_variables]
+        if fitting:
+            count = choose(position, fitting)
+            minibuckets[count].append(tables[position])
+            variables[count] |= scopes[position]
+        else:
+            minibuckets.append([tables[position]])
+            variables.append(scopes[position])
+            if opened is not None:
+                opened(position)
+    return minibuckets
+
+
+def scope_based(tables, max_variables):
+    # first fit decreasing on the scope size
+    scopes = [_scope(table) for table in tables]
+    order = sorted(range(len(tables)), key=lambda k: (-_popcount(scopes[k]), k))
+    return _first_fit(tables, scopes, order, max_variables, lambda position, fitting: fitting[0])
+
+
+def influence(table):
+    # mean change of the best summed cost of a key when each header flips, infinite costs counting as
+    # more than twice the largest finite one
+    totals = table.points.sum(axis=1)
+    finite = totals[np.isfinite(totals)]
+    cap = 2 * np.abs(finite).max() + 1 if len(finite) else 1
+    totals = np.where(np.isfinite(totals), totals, cap)
+    counts = np.diff(table.offsets)
+    best = np.full(len(table), cap)
+    filled = counts > 0
+    best[filled] = np.minimum.reduceat(totals, table.offsets[:-1][filled])
+    keys = np.arange(len(table))
+    values = {}
+    for bit, node in enumerate(table.headers):
+        unset = keys[(keys >> bit) & 1 == 0]
+        values[node.index] = float(np.abs(best[unset | (1 << bit)] - best[unset]).mean())
+    return values
+
+
+def content_based(tables, max_variables):
+    # the tables changing the most with their variables go first, each to the fitting mini-bucket whose
+    # tables depend the most on the same variables, so strongly coupled tables get eliminated together
+    scopes = [_scope(table) for table in tables]
+    influences = [influence(table) for table in tables]
+    order = sorted(range(len(tables)), key=lambda k: (-sum(influences[k].values()), -_popcount(scopes[k]), k))
+
+    # influence of every variable summed over the tables of each mini-bucket
+    summed = []
+
+    def choose(position, fitting):
+        def similarity(count):
+            return sum(min(value, summed[count].get(variable, 0)) for variable, value in influences[position].items())
+
+        count = max(fitting, key=similarity)
+        for variable, value in influences[position].items():
+            summed[count][variable] = summed[count].get(variable, 0) + value
+        return count
+
+    def opened(position):
+        summed.append(dict(influences[position]))
+
+    return _first_fit(tables, scopes, order, max_variables, choose, opened)
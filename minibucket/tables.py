@@ -0,0 +1,188 @@
+from math import inf
+
+import numpy as np
+
+from utils.pareto import non_dominated, pairs
+from utils.result_set import ResultSet
+from utils.vector import Vector
+
+
+def _ranges(starts, counts):
+    # concatenate the row ranges [start, start + count) of each group
+    total = counts.sum()
+    groups = np.repeat(np.arange(len(counts)), counts)
+    offsets = np.cumsum(counts) - counts
+    return starts[groups] + np.arange(total) - offsets[groups]
+
+
+def _summed(bits, costs, indexes):
+    # costs of the nodes set in every row of bits, column i being the node indexes[i], added one node at
+    # a time in node index order like Weights.cost so tables and vectors agree bit for bit
+    # nodes no row includes are skipped and the others add an exact zero to the rows leaving them out
+    order = np.argsort(indexes, kind='stable')
+    columns = order[bits.any(axis=0)[order]]
+    points = np.zeros((len(bits), costs.shape[1]), dtype=np.float64)
+    added = np.empty_like(points)
+    for column in columns.tolist():
+        np.multiply(bits[:, column, None], costs[indexes[column]], out=added)
+        points += added
+    return points
+
+
+def _offsets(counts):
+    offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    return offsets
+
+
+class CostTable:
+    def __init__(self, headers, offsets, points, members, weights, source=None):
+        self.headers = list(headers)
+        self.source = source
+        self.weights = weights
+
+        # rows offsets[key]:offsets[key + 1] hold the cost vectors of key, bit i of key being headers[i]
+        self.offsets = offsets
+        self.points = points
+
+        # packed little endian bitsets of the nodes included in each cost vector
+        self.members = members
+        self._results = {}
+
+        # order positions of the headers once compiled, bit i of a key being the value at positions[i]
+        self.positions = None
+        self.strides = None
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, key):
+        if key not in self._results:
+            results = ResultSet()
+            start, end = self.offsets[key], self.offsets[key + 1]
+            for values, members in zip(self.points[start:end].tolist(), self.members[start:end]):
+                if values[0] == inf:
+                    results.add(Vector(*values))
+                else:
+                    results.add(Vector(*values, mask=int.from_bytes(members.tobytes(), 'little'),
+                                       weights=self.weights))
+            self._results[key] = results
+        return self._results[key]
+
+    @property
+    def dense(self):
+        return len(self.points) == len(self)
+
+    @staticmethod
+    def create(headers, costs, weights):
+        headers = list(headers)
+        keys = np.arange(2 ** len(headers))
+        chosen = ((keys[:, None] >> np.arange(len(headers))) & 1).astype(np.uint8)
+
+        # sum costs of chosen nodes and mark them as included
+        indexes = np.array([node.index for node in headers], dtype=np.int64)
+        points = _summed(chosen, costs, indexes)
+        members = np.zeros((len(keys), len(weights.nodes)), dtype=np.uint8)
+        members[:, indexes] = chosen
+        members = np.packbits(members, axis=1, bitorder='little')
+        return CostTable(headers, _offsets(np.ones(len(keys), dtype=np.int64)), points, members, weights)
+
+    @staticmethod
+    def from_dict(table, weights, dimensions):
+        headers = table['headers']
+        width = (len(weights.nodes) + 7) // 8
+        counts, points, members = [], [], []
+        for key in range(2 ** len(headers)):
+            counts.append(len(table[key]))
+            for vector in table[key]:
+                points.append(tuple(vector))
+                members.append(vector.mask.to_bytes(width, 'little'))
+        points = np.array(points, dtype=np.float64).reshape(-1, dimensions)
+        members = np.frombuffer(b''.join(members), dtype=np.uint8).reshape(-1, width).copy()
+        return CostTable(headers, _offsets(np.array(counts, dtype=np.int64)), points, members, weights,
+                         source=table.get('from'))
+
+    def compile(self, positions):
+        self.positions = [positions[node] for node in self.headers]
+        self.strides = 1 << np.arange(len(self.headers), dtype=np.int64)
+
+    def key(self, assignment):
+        # unassigned headers count as not chosen
+        key = 0
+        for bit, position in enumerate(self.positions):
+            if position < len(assignment):
+                key |= assignment[position] << bit
+        return key
+
+    def keys(self, assignments):
+        # keys of many full assignments at once, one assignment per row
+        return np.asarray(assignments, dtype=np.int64)[:, self.positions] @ self.strides
+
+    def projection(self, headers):
+        # key of the given (sub)headers table for every key of this table
+        keys = np.arange(len(self))
+        projected = np.zeros(len(keys), dtype=np.int64)
+        for count, node in enumerate(headers):
+            projected |= ((keys >> self.headers.index(node)) & 1) << count
+        return projected
+
+    def add(self, other, costs):
+        projected = self.projection(other.headers)
+        counts = np.diff(self.offsets)
+        other_counts = np.diff(other.offsets)[projected]
+
+        # join every cost vector of a key with every cost vector of the matching other key
+        if self.dense and other.dense:
+            keys, rows, other_rows = np.arange(len(self)), np.arange(len(self)), projected
+        else:
+            keys, rows, other_rows = pairs(self.offsets[:-1], counts, other.offsets[projected], other_counts)
+        members = self.members[rows] | other.members[other_rows]
+        infinite = (self.points[rows, 0] == inf) | (other.points[other_rows, 0] == inf)
+        members[infinite] = 0
+
+        # equal cost vectors of the same key collapse like in a set
+        rows = np.concatenate((keys.astype('<i8').view(np.uint8).reshape(-1, 8),
+                               infinite.astype(np.uint8)[:, None], members), axis=1)
+        _, unique = np.unique(np.ascontiguousarray(rows).view(np.dtype((np.void, rows.shape[1]))).ravel(),
+                              return_index=True)
+        unique.sort()
+        members, infinite = members[unique], infinite[unique]
+
+        # costs are recomputed from the joined includes so shared nodes are counted once
+        # only the nodes some row includes are unpacked
+        nodes = np.flatnonzero(np.unpackbits(np.bitwise_or.reduce(members, axis=0), count=len(self.weights.nodes),
+                                             bitorder='little'))
+        bits = (members[:, nodes >> 3] >> (nodes & 7).astype(np.uint8)) & 1
+        points = _summed(bits, costs, nodes)
+        points[infinite] = inf
+
+        self.offsets = _offsets(np.bincount(keys[unique], minlength=len(self)))
+        self.points = points
+        self.members = members
+        self._results = {}
+
+    def eliminate(self, node):
+        position = self.headers.index(node)
+        headers = [item for item in self.headers if item != node]
+        if not headers:
+            raise Exception('Should not happen')
+
+        # join the keys where node is not chosen and chosen, in this order
+        keys = np.arange(2 ** len(headers))
+        unset = (keys & ((1 << position) - 1)) | ((keys >> position) << (position + 1))
+        joined = np.stack((unset, unset | (1 << position)), axis=1).ravel()
+        counts = np.diff(self.offsets)
+        rows = _ranges(self.offsets[joined], counts[joined])
+
+        table = CostTable(headers, _offsets(counts[unset] + counts[unset | (1 << position)]), self.points[rows],
+                          self.members[rows], self.weights, source=node)
+        table.remove_dominated()
+        return table
+
+    def remove_dominated(self):
+        keep = non_dominated(self.points, self.offsets)
+        groups = np.repeat(np.arange(len(self)), np.diff(self.offsets))
+        self.offsets = _offsets(np.bincount(groups[keep], minlength=len(self)))
+        self.points = self.points[keep]
+        self.members = self.members[keep]
+        self._results = {}
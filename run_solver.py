@@ -1,19 +1,164 @@
-import sys
 import os
-from solvers.hybridization import Solver
+import re
+import sys
+import json
+import time
+import traceback
+import resource
+import argparse
+import itertools
+import multiprocessing
+from multiprocessing.connection import wait
+
+from utils.graph import GRAPH_CACHE_SUFFIX
+from solvers.hybridization import Solver, RESULTS_DIR, BB_RESULTS
+
+CHECKPOINT = os.path.join(BB_RESULTS, 'jobs.jsonl')
+LOGS_DIR = os.path.join(RESULTS_DIR, 'logs')
+
+# exit codes of a job process
+OK = 0
+ERROR = 1
+MEMORY = 3
 
 
-# INSTANCE_DIR = "instances/bi-objective"
-INSTANCE_DIR = sys.argv[1]
+def job_key(instance, max_vars, method, seed):
+    return '{}_mbe{}_{}{}'.format(method, 'auto' if max_vars is None else max_vars, instance,
+                                  '' if seed is None else '_seed{}'.format(seed))
 
 
-def run_instance(instance, max_vars):
+def run_instance(instance, max_vars, method='bb', seed=None, time_limit=None, instrument=False, memory_budget=None,
+                 deepen=None, processes=None, workers=1, executor='thread'):
     dimensions = int(instance.split("_d")[1])
-    solver = Solver(instance, max_vars, dimensions, "bb")
+    solver = Solver(instance, max_vars, dimensions, method, seed, time_limit=time_limit, instrument=instrument,
+                    memory_budget=memory_budget if max_vars is None else None, deepen=deepen, processes=processes,
+                    workers=workers, executor=executor)
     solver.run()
 
 
-instances = os.listdir(INSTANCE_DIR)
-for instance in instances:
-    for i in [10, 10, 10, 10, 10, 10]:
-        run_instance(instance, i)
+def run_job(job, memory, log_path, budget=None, instrument=False, memory_budget=None, deepen=None, processes=None,
+            workers=1, executor='thread'):
+    # runs in a forked process, the address space being capped before anything is built
+    if memory:
+        resource.setrlimit(resource.RLIMIT_AS, (memory, memory))
+    with open(log_path, 'w') as log:
+        sys.stdout = sys.stderr = log
+        try:
+            run_instance(*job, time_limit=budget, instrument=instrument, memory_budget=memory_budget, deepen=deepen,
+                         processes=processes, workers=workers, executor=executor)
+        except MemoryError:
+            os._exit(MEMORY)
+        except BaseException:
+            traceback.print_exc()
+            log.flush()
+            os._exit(ERROR)
+        log.flush()
+    os._exit(OK)
+
+
+def read_checkpoint(path):
+    # last record of every job key
+    records = {}
+    if os.path.isfile(path):
+        with open(path) as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    record = json.loads(line)
+                    records[record['key']] = record
+    return records
+
+
+def write_checkpoint(path, record):
+    with open(path, 'a') as f:
+        f.write(json.dumps(record) + '\n')
+
+
+def schedule(jobs, records):
+    # longest expected first: jobs never timed come first, larger instances first, then by past timings
+    def expected(job):
+        record = records.get(job_key(*job))
+        nodes = re.match(r'n(\d+)', job[0])
+        return record['time'] if record else float('inf'), int(nodes.group(1)) if nodes else 0
+    return sorted(jobs, key=expected, reverse=True)
+
+
+def run_jobs(jobs, processes, timeout=None, memory=None, checkpoint=CHECKPOINT, budget=None,
+             instrument=False, memory_budget=None, deepen=None, search_processes=None, workers=1, executor='thread'):
+    records = read_checkpoint(checkpoint)
+    pending = [job for job in schedule(jobs, records) if records.get(job_key(*job), {}).get('status') != 'ok']
+    print('{} jobs, {} already done'.format(len(jobs), len(jobs) - len(pending)))
+    if not os.path.isdir(LOGS_DIR):
+        os.mkdir(LOGS_DIR)
+
+    # every job gets its own process so it can be stopped on timeout without losing the others
+    context = multiprocessing.get_context('fork')
+    running = {}
+    while pending or running:
+        while pending and len(running) < processes:
+            job = pending.pop(0)
+            log_path = os.path.join(LOGS_DIR, job_key(*job) + '.log')
+            process = context.Process(target=run_job, args=(job, memory, log_path, budget, instrument, memory_budget,
+                                                            deepen, search_processes, workers, executor))
+            process.start()
+            running[process.sentinel] = process, job, time.time()
+
+        # wait for a job to finish or for the closest deadline
+        remaining = None
+        if timeout:
+            remaining = max(0, min(start for _, _, start in running.values()) + timeout - time.time())
+        ready = wait(list(running), remaining)
+        now = time.time()
+        for sentinel in list(running):
+            process, job, start = running[sentinel]
+            if sentinel in ready:
+                process.join()
+                status = {OK: 'ok', MEMORY: 'memory'}.get(process.exitcode, 'error')
+            elif timeout and now - start >= timeout:
+                process.terminate()
+                process.join()
+                status = 'timeout'
+            else:
+                continue
+            del running[sentinel]
+            record = {'key': job_key(*job), 'instance': job[0], 'mbe': job[1], 'method': job[2], 'seed': job[3],
+                      'status': status, 'time': round(now - start, 2)}
+            write_checkpoint(checkpoint, record)
+            print('{:>8} {:>10.2f}s {}'.format(status, record['time'], record['key']))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the solvers on every instance of a directory')
+    parser.add_argument('instances', help='directory of the instances, e.g. instances/bi-objective')
+    parser.add_argument('-mbe', '--maxvars', default='10',
+                        help='comma separated i-bounds, auto picking the largest one fitting --table-memory')
+    parser.add_argument('-m', '--methods', default='bb', help='comma separated search methods (bb, pbb, nsga2)')
+    parser.add_argument('-s', '--seeds', default='', help='comma separated seeds, none by default')
+    parser.add_argument('-p', '--processes', type=int, default=multiprocessing.cpu_count())
+    parser.add_argument('-t', '--timeout', type=float, default=None, help='seconds per job')
+    parser.add_argument('-b', '--budget', type=float, default=None,
+                        help='seconds of search per job, after which the best front so far is written')
+    parser.add_argument('--memory', type=int, default=None, help='megabytes per job')
+    parser.add_argument('--checkpoint', default=CHECKPOINT)
+    parser.add_argument('--table-memory', type=int, default=1024, help='megabytes of bucket tables for auto i-bounds')
+    parser.add_argument('--deepen', type=float, default=None, help='seconds to rebuild with larger i-bounds')
+    parser.add_argument('--instrument', action='store_true', help='write counters and timings next to each result')
+    parser.add_argument('--search-processes', type=int, default=None,
+                        help='processes of each pbb or nsga2 search, all cores for pbb and one for nsga2 if unset')
+    parser.add_argument('--build-workers', type=int, default=1, help='workers reducing the buckets of each job')
+    parser.add_argument('--build-executor', default='thread', choices=('thread', 'process'),
+                        help='kind of the bucket reduction workers')
+    args = parser.parse_args()
+
+    instances = sorted(item for item in os.listdir(args.instances) if not item.endswith(GRAPH_CACHE_SUFFIX))
+    max_vars = [None if item == 'auto' else int(item) for item in args.maxvars.split(',')]
+    methods = args.methods.split(',')
+    seeds = [int(item) for item in args.seeds.split(',')] if args.seeds else [None]
+    jobs = list(itertools.product(instances, max_vars, methods, seeds))
+    run_jobs(jobs, args.processes, args.timeout, args.memory and args.memory << 20, args.checkpoint, args.budget,
+             args.instrument, args.table_memory << 20, args.deepen, args.search_processes, args.build_workers,
+             args.build_executor)
+
+
+if __name__ == '__main__':
+    main()
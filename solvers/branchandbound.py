@@ -1,50 +1,301 @@
+import time
+import multiprocessing
+from math import inf
+
+from utils.instrumentation import metrics
+from utils.pareto import DominanceIndex
+from utils.result_set import ResultSet
+from utils.vector import Vector
+
+# search inherited by the forked workers so the bucket tables are never pickled
+_worker = None
+
+
+def _search(prefix):
+    return _worker.search(prefix)
+
 
 class BranchAndBound:
-    def __init__(self, mbe_solver, n):
+    def __init__(self, mbe_solver, n, time_limit=None, node_limit=None, callback=None, pruning='dominance',
+                 child_order='suggested'):
         self.nr_vertices = n
         self.mbe_solver = mbe_solver
+        self.evaluator = mbe_solver.create_evaluator()
         self.pareto_front = None
+
+        # nadir pruning cuts a node once every lower bound is at least the worst front value on every
+        # objective, dominance pruning once every lower bound is weakly dominated by some front point
+        self.pruning = pruning
+        self.front_values = set()
+        self.nadir = None
+        self.index = None
+
+        # children are visited suggested value first, or lowest summed lower bound first with heuristic
+        self.child_order = child_order
+
         self.max_branches = pow(2, n)
         self.last_progress = 0
 
+        # visited nodes and assignments covered by the finished subtrees
+        self.visited = 0
+        self.explored = 0
+
+        # the search stops with the front found so far once it runs for time_limit seconds or visits
+        # node_limit nodes; front updates not reported yet are kept in improvements
+        self.time_limit = time_limit
+        self.node_limit = node_limit
+        self.callback = callback
+        self.start_time = None
+        self.stopped = False
+        self.improvements = []
+
     def init_paretofront(self, path):
-        if len(path) == self.nr_vertices:
-            cost, ba = self.mbe_solver.compute_cost(path)
-            self.pareto_front = cost
-            return
-        cost, best_next_assignment = self.mbe_solver.compute_cost(path)
-        path += [best_next_assignment]
-        self.init_paretofront(path)
-
-    def add_solution(self, path):
-        cost, ba = self.mbe_solver.compute_cost(path)
-        new_progress = round(int(''.join(map(str, path)), 2)/self.max_branches, 2)
+        # follow the suggested values down to a full assignment
+        self.evaluator.seek(path)
+        cost, best_next_assignment = self.evaluator.cost()
+        while len(self.evaluator) < self.nr_vertices:
+            self.evaluator.push(best_next_assignment)
+            cost, best_next_assignment = self.evaluator.cost()
+        self.set_front(cost)
+        self.improved()
+
+    def set_front(self, front):
+        # the front and its pruning data are kept as they are while the front values stay the same
+        front_values = set(tuple(vector) for vector in front)
+        if self.pareto_front is not None and front_values == self.front_values:
+            return False
+        self.pareto_front = front
+        self.front_values = front_values
+        if self.pruning == 'dominance':
+            self.index = DominanceIndex(self.front_values)
+        elif self.pruning == 'nadir':
+            self.nadir = tuple(max(values) for values in zip(*self.front_values))
+        else:
+            raise ValueError('unknown pruning: {}'.format(self.pruning))
+        return True
+
+    def add_solution(self, cost):
+        if self.set_front(self.pareto_front.__or__(cost)):
+            self.improved()
+
+    def improved(self, status='running'):
+        self.improvements.append({
+            'status': status,
+            'time': round(time.time() - self.start_time, 3),
+            'visited': self.visited,
+            'explored': self.explored,
+            'pareto_front': [list(vector) for vector in self.pareto_front],
+        })
+
+    def flush(self):
+        improvements, self.improvements = self.improvements, []
+        return improvements
+
+    def exhausted(self):
+        if self.time_limit is not None and time.time() - self.start_time >= self.time_limit or \
+                self.node_limit is not None and self.visited >= self.node_limit:
+            self.stopped = True
+        return self.stopped
+
+    def bound(self, cost):
+        if not cost or not self.front_values:
+            return False
+        if self.pruning == 'dominance':
+            return self.index.all_dominated(cost)
+
+        # same as cost > front without comparing every pair: every lower bound is at least every front
+        # point, unless they are all the same vector
+        if not all(all(x >= y for x, y in zip(vector, self.nadir)) for vector in cost):
+            return False
+        return len(self.front_values.union(tuple(vector) for vector in cost)) > 1
+
+    def finish(self, depth):
+        self.explored += 1 << (self.nr_vertices - depth)
+        new_progress = round(self.explored / self.max_branches, 2)
         if self.last_progress != new_progress:
             print("Progress: {}%".format(int(new_progress * 100)))
             self.last_progress = new_progress
-        self.pareto_front = self.pareto_front.__or__(cost)
 
-    def bound(self, path):
-        cost, ba = self.mbe_solver.compute_cost(path)
-        return cost.__gt__(self.pareto_front)
+    def expand(self):
+        # evaluate the current node once and return its children, suggested value first
+        depth = len(self.evaluator)
+        cost, best_next_assignment = self.evaluator.cost()
+        self.visited += 1
+        if self.bound(cost):
+            if metrics.enabled:
+                metrics.histogram('bb.pruned', depth)
+            self.finish(depth)
+            return []
+        if metrics.enabled:
+            metrics.histogram('bb.expanded', depth)
 
-    def branch(self, path):
-        if self.bound(path):
-            return
+        if depth == self.nr_vertices:
+            self.add_solution(cost)
+            self.finish(depth)
+            return []
 
-        if len(path) == self.nr_vertices:
-            self.add_solution(path)
-            return
+        if self.child_order == 'heuristic':
+            return self.order_children(best_next_assignment)
+        return [1 - best_next_assignment, best_next_assignment]
 
-        for j in range(0, 2):
-            path.append(j)
-            self.branch(path)
-            path[-1:] = []
+    def order_children(self, best_next_assignment):
+        # children left to visit, the one with the lowest summed lower bound last so it is visited first,
+        # the suggested one on ties
+        def key(value):
+            results = self.evaluator.branches[value]
+            return min((sum(vector) for vector in results), default=inf) if results else inf
 
-    def run(self):
+        other = 1 - best_next_assignment
+        if key(other) < key(best_next_assignment):
+            return [best_next_assignment, other]
+        return [other, best_next_assignment]
+
+    def branch(self, path):
+        # depth first search keeping the children left to visit below every node of the path, yielding the
+        # front updates as they are found
+        self.evaluator.seek(path)
+        stack = [self.expand()]
+        while stack:
+            if self.improvements:
+                yield from self.flush()
+            if self.exhausted():
+                return
+            if stack[-1]:
+                value = stack[-1].pop()
+                path.append(value)
+                self.evaluator.push(value)
+                stack.append(self.expand())
+            else:
+                stack.pop()
+                if stack:
+                    self.evaluator.pop()
+                    path.pop()
+
+    def iterate(self):
+        # anytime search, every update holding the whole front; the last one tells if the search completed
+        self.start_time = time.time()
+        self.stopped = False
         self.init_paretofront([0])
-        self.branch([])
+        yield from self.flush()
+        yield from self.branch([])
+        self.improved('stopped' if self.stopped else 'complete')
+        yield from self.flush()
+
+    def run(self):
+        for update in self.iterate():
+            if self.callback is not None:
+                self.callback(update)
         return self.pareto_front
 
 
+class ParallelBranchAndBound(BranchAndBound):
+    def __init__(self, mbe_solver, n, processes=None, split_depth=8, sync_interval=256, capacity=1024, time_limit=None,
+                 node_limit=None, callback=None, pruning='dominance', child_order='suggested'):
+        super(ParallelBranchAndBound, self).__init__(mbe_solver, n, time_limit, node_limit, callback, pruning,
+                                                     child_order)
+        self.processes = processes or multiprocessing.cpu_count()
+        self.split_depth = min(split_depth, n)
+        self.sync_interval = sync_interval
+        self.capacity = capacity
+        self.dimensions = mbe_solver.dimensions
+
+        # prefixes left for the workers while splitting, shared front and the solutions found by a worker
+        self.tasks = None
+        self.shared = None
+        self.solutions = None
+
+        # node_limit bounds the nodes of all processes together: workers add the nodes they visited to a
+        # shared counter whenever they synchronize and stop once it reaches the limit, so the total goes
+        # past it by at most about sync_interval nodes per worker
+        self.reported = 0
+        self.total_visited = 0
+
+    def add_solution(self, cost):
+        super(ParallelBranchAndBound, self).add_solution(cost)
+        if self.solutions is not None:
+            self.solutions |= cost
+
+    def improved(self, status='running'):
+        # workers leave the updates to the main process
+        if self.solutions is None:
+            super(ParallelBranchAndBound, self).improved(status)
+
+    def finish(self, depth):
+        # workers leave progress to the main process
+        if self.solutions is None:
+            super(ParallelBranchAndBound, self).finish(depth)
+
+    def expand(self):
+        # subtrees below the split depth are left to the workers
+        if self.tasks is not None and len(self.evaluator) == self.split_depth:
+            self.tasks.append(tuple(self.evaluator.path))
+            return []
+        if self.solutions is not None and self.visited % self.sync_interval == 0:
+            self.synchronize()
+        return super(ParallelBranchAndBound, self).expand()
+
+    def exhausted(self):
+        if self.solutions is not None and self.node_limit is not None and \
+                self.total_visited + self.visited - self.reported >= self.node_limit:
+            self.stopped = True
+        return super(ParallelBranchAndBound, self).exhausted()
+
+    def synchronize(self):
+        # merge the shared front into this front and publish the result, along with the nodes visited since
+        # the last time
+        points, count, visited, lock = self.shared
+        with lock:
+            visited.value += self.visited - self.reported
+            self.reported = self.visited
+            self.total_visited = visited.value
+            shared = ResultSet(Vector(*points[index * self.dimensions:(index + 1) * self.dimensions])
+                               for index in range(count.value))
+            self.set_front(self.pareto_front.__or__(shared))
+            values = [tuple(vector) for vector in self.pareto_front][:self.capacity]
+            for index, value in enumerate(values):
+                points[index * self.dimensions:(index + 1) * self.dimensions] = value
+            count.value = len(values)
+
+    def search(self, prefix):
+        # solve the subtree of one prefix in a worker, within the budget left
+        self.solutions = ResultSet()
+        self.synchronize()
+        visited = self.visited
+        for _ in self.branch(list(prefix)):
+            pass
+        self.synchronize()
+        return [(tuple(vector), vector.mask) for vector in self.solutions], self.visited - visited
+
+    def iterate(self):
+        global _worker
+        self.start_time = time.time()
+        self.stopped = False
+        self.init_paretofront([0])
+        yield from self.flush()
+
+        # split the tree at the prefix depth, pruning with the initial front on the way
+        self.tasks = []
+        yield from self.branch([])
+        tasks, self.tasks = self.tasks, None
 
+        # workers are forked after the shared front exists and pick prefixes one at a time
+        context = multiprocessing.get_context('fork')
+        self.shared = (context.RawArray('d', self.capacity * self.dimensions), context.RawValue('i', 0),
+                       context.RawValue('q', self.visited), context.Lock())
+        self.reported = self.visited
+        weights = self.mbe_solver.original_weights
+        _worker = self
+        try:
+            with context.Pool(self.processes) as pool:
+                for solutions, visited in pool.imap_unordered(_search, [] if self.stopped else tasks):
+                    self.visited += visited
+                    self.add_solution(ResultSet(Vector(*values, mask=mask, weights=weights)
+                                                for values, mask in solutions))
+                    self.finish(self.split_depth)
+                    yield from self.flush()
+                    if self.exhausted():
+                        break
+        finally:
+            _worker = None
+        self.improved('stopped' if self.stopped else 'complete')
+        yield from self.flush()
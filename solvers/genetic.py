@@ -1,17 +1,31 @@
 import time
 import random
+import multiprocessing
 from math import inf
-from itertools import chain
 
+import numpy as np
+
+from solvers.population import Population
+from utils import pareto
 from utils.result_set import ResultSet
+from utils.instrumentation import metrics
+from utils.vector import Vector
+
+# heuristics inherited by the forked evaluation workers so the bucket tables are never pickled
+_heuristics = None
+
+
+def _evaluate(chromosomes):
+    return _heuristics.compute_costs(chromosomes)[1]
 
 
 class NSGA2:
     def __init__(self, order, heuristics, generations=100, population_size=100,
-                 k_parents=2, crossover_chance=0.6, mutation_chance=0.4):
+                 k_parents=2, crossover_chance=0.6, mutation_chance=0.4, processes=1):
         self.order = order
         self.nodes_count = len(order)
         self.heuristics = heuristics
+        self.evaluator = heuristics.create_evaluator()
         self.dimensions = heuristics.dimensions
         self.generations = generations
         self.population_size = population_size
@@ -20,6 +34,10 @@ class NSGA2:
         self.crossover_chance = crossover_chance
         self.mutation_chance = mutation_chance / self.nodes_count
 
+        # costs are computed in batches, on a pool of forked workers when more than one process is used
+        self.processes = processes or multiprocessing.cpu_count()
+        self.pool = None
+
         self.generate_strategy = 'random'
         # self.generate_strategy = 'prefix'
         # self.generate_strategy = 'heuristic'
@@ -34,18 +52,55 @@ class NSGA2:
         self.this_population, self.next_population = self.generate_population()
 
     def run(self):
+        try:
+            self._run()
+        finally:
+            self.close()
+        return self.pareto_front()
+
+    def pareto_front(self):
+        # non-dominated costs of the current population, with the nodes each one includes
+        weights = self.heuristics.original_weights
+        front = ResultSet()
+        for index in range(len(self.this_population)):
+            cost = self.this_population.cost(index)
+            if cost[0] == inf:
+                front.add(Vector(*cost))
+                continue
+            chromosome = self.this_population.chromosome(index)
+            front.add(Vector(*cost, mask=sum(1 << node.index for value, node in zip(chromosome, self.order) if value),
+                             weights=weights))
+        front.remove_dominated()
+        return front
+
+    def _run(self):
         for generation in range(self.generations):
             print('Generation', generation + 1)
 
             # crossover
+            start_time = time.perf_counter()
             self.crossover()
 
             # mutation
+            crossover_time = time.perf_counter()
             self.mutation()
 
+            # compute costs of the new and changed individuals
+            mutation_time = time.perf_counter()
+            self.evaluate(self.next_population)
+
             # sort population according to domination rank and crowding distance
+            evaluation_time = time.perf_counter()
             self.next_population = self.selection(*self.sort_population())
-            self.this_population = self.copy_individuals(self.next_population)
+            self.this_population = self.next_population.copy()
+
+            if metrics.enabled:
+                metrics.append('nsga2.generations', {
+                    'crossover': round(crossover_time - start_time, 6),
+                    'mutation': round(mutation_time - crossover_time, 6),
+                    'evaluation': round(evaluation_time - mutation_time, 6),
+                    'selection': round(time.perf_counter() - evaluation_time, 6),
+                })
 
             # self.crossover_chance *= 0.99
             # self.mutation_chance *= 1.1
@@ -53,31 +108,69 @@ class NSGA2:
 
     def generate_population(self):
         if self.generate_strategy == 'random':
-            return self._generate_random_population()
+            populations = self._generate_random_population()
         elif self.generate_strategy == 'prefix':
-            return self._generate_prefix_population()
+            populations = self._generate_prefix_population()
         elif self.generate_strategy == 'heuristic':
-            return self._generate_heuristic_population()
+            populations = self._generate_heuristic_population()
+        else:
+            return None
+
+        for population in populations:
+            self.evaluate(population)
+        return populations
+
+    def create_population(self, capacity=0):
+        return Population(self.nodes_count, self.dimensions, capacity)
+
+    def compute_cost(self, chromosome):
+        return self.heuristics.compute_cost(chromosome)[0].pop()
+
+    def evaluate(self, population):
+        pending = population.unevaluated()
+        if not len(pending):
+            return
+
+        # split the pending chromosomes in chunks and get their costs back in order
+        chromosomes = population.chromosomes[pending]
+        if self.processes == 1:
+            costs = self.heuristics.compute_costs(chromosomes)[1]
+        else:
+            chunks = np.array_split(chromosomes, min(len(chromosomes), 4 * self.processes))
+            costs = np.concatenate(self.get_pool().map(_evaluate, chunks))
+        population.costs[pending] = costs
+        population.pending[pending] = False
+
+    def get_pool(self):
+        global _heuristics
+        if self.pool is None:
+            _heuristics = self.heuristics
+            self.pool = multiprocessing.get_context('fork').Pool(self.processes)
+        return self.pool
+
+    def close(self):
+        global _heuristics
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+            _heuristics = None
 
     def _generate_random_population(self, zero_chance=0.2):
         populations = []
 
         # initialise chromosomes for current and next population
         for _ in range(2):
-            population = []
+            population = self.create_population(self.population_size)
             for count in range(self.population_size):
                 chromosome = [0 if random.random() < zero_chance else 1 for _ in range(self.nodes_count)]
-                new_individual = {
-                    'chromosome': chromosome,
-                    'cost': self.heuristics.compute_cost(chromosome)[0].pop()
-                }
-                population.append(new_individual)
+                population.add(chromosome)
             populations.append(population)
 
         return populations
 
     def _generate_prefix_population(self):
-        populations = []
+        populations = [self.create_population(self.population_size), self.create_population(self.population_size)]
 
         viable = 2 * self.population_size
         min_length = len(bin(viable)) - 2
@@ -85,158 +178,127 @@ class NSGA2:
         while viable:
             # get best assignment starting with this prefix
             partial_assignment = list(map(int, bin(counter)[2:].ljust(min_length, '0')))
-            result, next_best = self.heuristics.compute_cost(partial_assignment)
+            self.evaluator.seek(partial_assignment)
+            result, next_best = self.evaluator.cost()
             while not all(all(value == inf for value in cost) for cost in result) and \
                     len(partial_assignment) < self.nodes_count:
                 partial_assignment.append(next_best)
                 if len(partial_assignment) == self.nodes_count:
                     break
-                result, next_best = self.heuristics.compute_cost(partial_assignment)
+                self.evaluator.push(next_best)
+                result, next_best = self.evaluator.cost()
 
             # check if full solution and add to population
             if len(partial_assignment) == self.nodes_count:
-                populations.append({
-                    'chromosome': partial_assignment,
-                    'cost': self.heuristics.compute_cost(partial_assignment)[0].pop()
-                })
+                population = populations[0] if len(populations[0]) < self.population_size else populations[1]
+                population.add(partial_assignment)
                 viable -= 1
 
             counter += 1
 
-        return populations[:self.population_size], populations[self.population_size:]
+        return populations
 
     def _generate_heuristic_population(self, heuristic_chance=0.5):
         populations = []
 
         # initialise chromosomes for current and next population
         for _ in range(2):
-            population = []
+            population = self.create_population(self.population_size)
             for count in range(self.population_size):
                 chromosome = []
+                self.evaluator.seek(chromosome)
                 for _ in range(self.nodes_count):
                     if random.random() < heuristic_chance:
-                        _, next_best = self.heuristics.compute_cost(chromosome)
+                        _, next_best = self.evaluator.cost()
                         chromosome.append(next_best)
                     else:
                         chromosome.append(1)
-
-                new_individual = {
-                    'chromosome': chromosome,
-                    'cost': self.heuristics.compute_cost(chromosome)[0].pop()
-                }
-                population.append(new_individual)
+                    self.evaluator.push(chromosome[-1])
+                population.add(chromosome)
             populations.append(population)
 
         return populations
 
     def sort_population(self, combined=None, keep_best=None):
         # combine first and this population then sort and select next population
-        combined = combined or (self.this_population + self.next_population)
+        combined = combined or self.this_population.concatenate(self.next_population)
         keep_best = keep_best or int(self.population_size * self.sort_percentage)
 
-        # clean domination count and dominates for all individuals to be sorted
-        for item in combined:
-            if 'domination_count' in item:
-                del item['domination_count']
-            if 'dominates' in item:
-                del item['dominates']
-            if 'rank' in item:
-                del item['rank']
-
-        # compute domination rank for each chromosome
-        first_front = []
-        for first_count, first_individual in enumerate(combined):
-            first_individual.setdefault('domination_count', 0)
-            first_individual.setdefault('dominates', [])
-
-            for second_individual in combined[first_count + 1:]:
-                second_individual.setdefault('domination_count', 0)
-                second_individual.setdefault('dominates', [])
-
-                if first_individual['cost'] < second_individual['cost']:
-                    first_individual['dominates'].append(second_individual)
-                    second_individual['domination_count'] += 1
-                elif first_individual['cost'] > second_individual['cost']:
-                    second_individual['dominates'].append(first_individual)
-                    first_individual['domination_count'] += 1
-
-            # check if first individual belongs to the first front
-            if not first_individual['domination_count']:
-                first_individual['rank'] = 0
-                first_front.append(first_individual)
-
-        print('First front ({})'.format(len(first_front)), [item['cost'] for item in first_front][:10])
-
-        # build next fronts starting from first front
+        # domination rank of every individual from the cost matrix
+        costs = combined.costs[:len(combined)]
+        ranks = pareto.ranks(costs)
+        first_front = np.flatnonzero(ranks == 0)
+        combined.ranks[first_front] = 0
+
+        print('First front ({})'.format(len(first_front)), [combined.cost(index) for index in first_front[:10]])
+
+        # build next fronts starting from first front, ordered by the last individual of the previous front
+        # dominating them
         counter = 0
         fronts = [first_front]
         already_added = len(first_front)
         while already_added < keep_best:
-            next_front = []
-            for individual in fronts[counter]:
-                for dominated in individual['dominates']:
-                    dominated['domination_count'] -= 1
-                    if not dominated['domination_count']:
-                        dominated['rank'] = counter + 1
-                        next_front.append(dominated)
+            previous = fronts[counter]
+            members = np.flatnonzero(ranks == counter + 1)
+            dominated = (costs[previous, None] <= costs[None, members]).all(axis=2) & \
+                (costs[previous, None] < costs[None, members]).any(axis=2)
+            last = (dominated * np.arange(1, len(previous) + 1)[:, None]).max(axis=0, initial=0)
+            next_front = members[np.lexsort((members, last))]
+            combined.ranks[next_front] = counter + 1
             counter += 1
             already_added += len(next_front)
             fronts.append(next_front)
 
         # add other as last front in order to assign them a rank and a distance for tournament selection
-        last_front = []
-        for individual in combined:
-            if 'rank' in individual:
-                continue
-            individual['rank'] = counter + 1
-            last_front.append(individual)
-        if last_front:
+        last_front = np.flatnonzero(ranks > counter)
+        combined.ranks[last_front] = counter + 1
+        if len(last_front):
             fronts.append(last_front)
 
         # compute crowding distance on each front
-        self.crowding_distance(fronts)
+        self.crowding_distance(combined, fronts)
 
         # select best individuals according to crowding domination
-        if last_front:
-            return sorted(chain(*fronts[:-1]), key=lambda x: (x['rank'], -x['distance']))[:keep_best], last_front
+        chosen = np.concatenate(fronts[:-1] if len(last_front) else fronts)
+        keys = list(zip(combined.ranks[chosen].tolist(), (-combined.distances[chosen]).tolist()))
+        chosen = [chosen[position] for position in sorted(range(len(chosen)), key=keys.__getitem__)]
+        if len(last_front):
+            return combined.take(chosen[:keep_best]), combined.take(last_front)
         else:
-            return sorted(chain(*fronts), key=lambda x: (x['rank'], -x['distance']))[:self.population_size], last_front
+            return combined.take(chosen[:self.population_size]), combined.take(last_front)
 
     @staticmethod
-    def crowding_distance(fronts):
+    def crowding_distance(population, fronts):
         for front in fronts:
             # initialize distances
-            for individual in front:
-                individual['distance'] = 0
+            population.distances[front] = 0
 
-            # for each objective sort and add distance
-            objectives_count = len(front[0]['cost'])
-            for dimension in range(objectives_count):
-                sorted_front = sorted(front, key=lambda x: x['cost'][dimension])
+            # for each objective sort and add distance, infeasible costs giving nan like plain floats do
+            for dimension in range(population.costs.shape[1]):
+                values = population.costs[front, dimension]
+                order = np.argsort(values, kind='stable')
+                sorted_front, values = front[order], values[order]
 
-                # save min and max values of this objective to normalize
-                min_value = sorted_front[0]['cost'][dimension]
-                max_value = sorted_front[-1]['cost'][dimension]
-                factor = (max_value - min_value) or 10 ** -6
+                with np.errstate(invalid='ignore'):
+                    # save min and max values of this objective to normalize
+                    factor = (values[-1] - values[0]) or 10 ** -6
 
-                # keep the most extreme solutions of this front
-                sorted_front[0]['distance'] = sorted_front[-1]['distance'] = inf
+                    # keep the most extreme solutions of this front
+                    population.distances[sorted_front[[0, -1]]] = inf
 
-                # update distance for each individual that is not an edge of the front
-                for position, individual in enumerate(sorted_front[1:-1], 1):
-                    individual['distance'] += (sorted_front[position + 1]['cost'][dimension] -
-                                               sorted_front[position - 1]['cost'][dimension]) / factor
+                    # update distance for each individual that is not an edge of the front
+                    population.distances[sorted_front[1:-1]] += (values[2:] - values[:-2]) / factor
 
     def selection(self, temp_population, remaining):
         # tournament selection using rank and crowding distance
         while len(temp_population) < self.population_size:
-            first, second = random.sample(remaining, 2)
-            if (first['rank'], -first['distance']) < (second['rank'], -second['distance']):
+            first, second = random.sample(range(len(remaining)), 2)
+            if (remaining.ranks[first], -remaining.distances[first]) < \
+                    (remaining.ranks[second], -remaining.distances[second]):
                 chosen = first
             else:
                 chosen = second
-            new_individual = self.copy_individual(chosen)
-            temp_population.append(new_individual)
+            temp_population.add_from(remaining, chosen)
         return temp_population
 
     def crossover(self):
@@ -248,9 +310,10 @@ class NSGA2:
             return self._vertex_cover_crossover()
 
     def _partial_parent_crossover(self):
+        population = self.next_population
         for count in range(int(self.population_size * self.crossover_chance)):
-            chosen_parents = random.sample(self.next_population, self.k_parents)
-            new_individual = {'chromosome': [], 'cost': None}
+            chosen_parents = random.sample(range(len(population)), self.k_parents)
+            chromosome = []
 
             # choose each position according to best partial assignment of parent
             for position in range(self.nodes_count):
@@ -258,50 +321,54 @@ class NSGA2:
                 parent_costs = []
                 result_set = ResultSet()
                 for parent in chosen_parents:
-                    this_cost = self.heuristics.compute_cost(parent['chromosome'][:position + 1])[0]
+                    this_cost = self.heuristics.compute_cost(population.chromosome(parent)[:position + 1])[0]
                     parent_costs.append(this_cost)
                     result_set |= this_cost
                 best_cost, index = max((len(result_set & cost), count) for count, cost in enumerate(parent_costs))
-                new_individual['chromosome'].append(chosen_parents[index]['chromosome'][position])
+                chromosome.append(int(population.chromosomes[chosen_parents[index], position]))
 
             # compute cost of new individual
-            new_individual['cost'] = self.heuristics.compute_cost(new_individual['chromosome'])[0].pop()
+            cost = self.compute_cost(chromosome)
 
             # replace worst parent with new child
-            worst_parent = min(chosen_parents, key=lambda k: k['cost'])
-            self.next_population.remove(worst_parent)
-            self.next_population.append(new_individual)
+            worst_parent = min(chosen_parents, key=lambda k: Vector(*population.cost(k)))
+            population.remove(population.find(worst_parent))
+            population.add(chromosome, cost)
 
     def _majority_crossover(self):
+        population = self.next_population
         for count in range(int(self.population_size * self.crossover_chance)):
-            chosen_parents = random.sample(self.next_population, self.k_parents)
-            new_individual = {'chromosome': [], 'cost': None}
+            chosen_parents = population.chromosomes[random.sample(range(len(population)), self.k_parents)]
+            chromosome = []
+            self.evaluator.seek(chromosome)
 
             # choose each position either using MBE heuristic or the majority of the parents
+            ones = chosen_parents.all(axis=0).tolist()
+            zeros = (~chosen_parents.any(axis=0)).tolist()
             for position in range(self.nodes_count):
-                if all(parent['chromosome'][position] == 1 for parent in chosen_parents):
-                    new_individual['chromosome'].append(1)
-                elif all(parent['chromosome'][position] == 0 for parent in chosen_parents):
-                    new_individual['chromosome'].append(0)
+                if ones[position]:
+                    chromosome.append(1)
+                elif zeros[position]:
+                    chromosome.append(0)
                 else:
-                    partial_cost, next_best = self.heuristics.compute_cost(new_individual['chromosome'])
-                    new_individual['chromosome'].append(next_best)
+                    partial_cost, next_best = self.evaluator.cost()
+                    chromosome.append(next_best)
+                self.evaluator.push(chromosome[-1])
 
-            # compute cost of new individual and add to population
-            new_individual['cost'] = self.heuristics.compute_cost(new_individual['chromosome'])[0].pop()
-            self.next_population.append(new_individual)
+            # add new individual to population, its cost is computed with the rest of the batch
+            population.add(chromosome)
 
     def _vertex_cover_crossover(self):
+        population = self.next_population
         for count in range(int(self.population_size * self.crossover_chance)):
-            first_parent, second_parent = random.sample(self.next_population, 2)
-            first_child, second_child = self.copy_individual(first_parent), self.copy_individual(second_parent)
+            first_parent, second_parent = random.sample(range(len(population)), 2)
+            first_chromosome, second_chromosome = population.chromosome(first_parent), \
+                population.chromosome(second_parent)
 
             # choose random node to swap hard constraint solution for
             position = random.randrange(0, self.nodes_count)
             chosen_node = self.order[position]
 
-            first_chromosome = first_child['chromosome']
-            second_chromosome = second_child['chromosome']
             first_chromosome[position], second_chromosome[position] = \
                 second_chromosome[position], first_chromosome[position]
             for neighbor in chosen_node.neighbors:
@@ -309,11 +376,10 @@ class NSGA2:
                 first_chromosome[position], second_chromosome[position] = \
                     second_chromosome[position], first_chromosome[position]
 
-            # add new nodes to population
-            first_child['cost'] = self.heuristics.compute_cost(first_child['chromosome'])[0].pop()
-            second_child['cost'] = self.heuristics.compute_cost(second_child['chromosome'])[0].pop()
-            self.next_population.append(first_child)
-            self.next_population.append(second_child)
+            # add new nodes to population, their costs are computed with the rest of the batch
+            population.add(first_chromosome, None, population.ranks[first_parent], population.distances[first_parent])
+            population.add(second_chromosome, None, population.ranks[second_parent],
+                           population.distances[second_parent])
 
     def mutation(self):
         if self.mutation_strategy == 'vertex_cover':
@@ -323,50 +389,41 @@ class NSGA2:
 
     def _vertex_cover_mutation(self):
         # vertex cover specific mutation
-        for individual in self.next_population:
+        population = self.next_population
+        for individual in range(len(population)):
+            chromosome = population.chromosomes[individual]
             changed = False
             for position in range(self.nodes_count):
                 random_number = random.random()
                 if random_number < self.mutation_chance / 2:
                     # if change from 1 to 0 set neighbors to 1; if change from 0 to 1 set neighbors to 0
-                    value = individual['chromosome'][position]
-                    individual['chromosome'][position] = 1 - value
+                    value = chromosome[position]
+                    chromosome[position] = 1 - value
                     node = self.order[position]
                     for neighbor in node.neighbors:
-                        individual['chromosome'][self.order.index(neighbor)] = value
+                        chromosome[self.order.index(neighbor)] = value
                     changed = True
                 elif random_number < self.mutation_chance:
-                    individual['chromosome'][position] = 1 - individual['chromosome'][position]
+                    chromosome[position] = 1 - chromosome[position]
                     changed = True
             if changed:
-                individual['cost'] = self.heuristics.compute_cost(individual['chromosome'])[0].pop()
+                population.pending[individual] = True
 
     def _heuristic_mutation(self):
         # use heuristics to decide new value for a given position
-        for individual in self.next_population:
+        population = self.next_population
+        for individual in range(len(population)):
+            chromosome = population.chromosomes[individual]
             changed = False
             for position in range(self.nodes_count):
                 random_number = random.random()
                 if random_number < self.mutation_chance / 2:
-                    this_chromosome = individual['chromosome']
-                    _, next_best = self.heuristics.compute_cost(this_chromosome[:position])
-                    this_chromosome[position] = next_best
+                    self.evaluator.seek(chromosome[:position].tolist())
+                    _, next_best = self.evaluator.cost()
+                    chromosome[position] = next_best
                     changed = True
                 elif random_number < self.mutation_chance:
-                    individual['chromosome'][position] = 1 - individual['chromosome'][position]
+                    chromosome[position] = 1 - chromosome[position]
                     changed = True
             if changed:
-                individual['cost'] = self.heuristics.compute_cost(individual['chromosome'])[0].pop()
-
-    @staticmethod
-    def copy_individuals(individuals):
-        return [NSGA2.copy_individual(individual) for individual in individuals]
-
-    @staticmethod
-    def copy_individual(individual):
-        return {
-            'chromosome': list(individual['chromosome']),
-            'cost': individual['cost'],
-            'rank': individual.get('rank'),
-            'distance': individual.get('distance'),
-        }
+                population.pending[individual] = True
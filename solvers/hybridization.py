@@ -1,13 +1,13 @@
 import os
 import json
 import time
+import random
 import argparse
-from math import inf
-from utils.vector import Vector
+import numpy as np
 from solvers.genetic import NSGA2
-from utils.graph import read_graph
-from utils.result_set import ResultSet
-from solvers.branchandbound import BranchAndBound
+from utils.graph import read_graph, vertex_cover_cost
+from utils.instrumentation import metrics
+from solvers.branchandbound import BranchAndBound, ParallelBranchAndBound
 from minibucket.heuristics import get_variables_order, MiniBucket
 
 ROOT = os.path.abspath(os.path.join(__file__, os.pardir, os.pardir))
@@ -19,6 +19,9 @@ RESULTS_DIR = os.path.join(ROOT, 'results')
 BB_RESULTS = os.path.join(RESULTS_DIR, 'bb')
 MONO = os.path.join(BB_RESULTS, 'mono-objective')
 BI = os.path.join(BB_RESULTS, 'bi-objective')
+
+# compiled buckets shared by the runs of the same instance and i-bound
+CACHE_DIR = os.path.join(ROOT, 'cache', 'buckets')
 if not os.path.isdir(RESULTS_DIR):
     os.mkdir(RESULTS_DIR)
 
@@ -32,72 +35,105 @@ if not os.path.isdir(BI):
     os.mkdir(BI)
 
 
-parser = argparse.ArgumentParser(description='Solver MO-BB')
-parser.add_argument("-i", "--instance", help="n10_ep0.5_d2")
-parser.add_argument("-mbe", "--maxvars", help="2")
-args = parser.parse_args()
-
-INSTANCE = args.instance
-DIMENSIONS = int(args.instance.split("_d")[1])
-MINI_BUCKETS = int(args.maxvars)
-
-
-def vertex_cover_cost(first_node, second_node):
-    return {
-        'headers': [first_node, second_node],
-        0: ResultSet((Vector(*(inf for _ in range(len(first_node.cost)))),)),
-        1: ResultSet((first_node.cost,)),
-        2: ResultSet((second_node.cost,)),
-        3: ResultSet((first_node.cost + second_node.cost,)),
-    }
-
-
 class Solver:
-    def __init__(self, instance, minibuckets, dimensions, search_method):
+    def __init__(self, instance, minibuckets, dimensions, search_method, seed=None, time_limit=None, node_limit=None,
+                 instrument=False, memory_budget=None, deepen=None, processes=None, workers=1, executor='thread'):
         self.instance = instance
         self.minibuckets = minibuckets
         self.dimensions = dimensions
         self.search_method = search_method
+        self.seed = seed
+        self.stream = None
+        self.instrument = instrument
+        if instrument:
+            metrics.reset()
+            metrics.enable()
+        if seed is not None:
+            random.seed(seed)
+            np.random.seed(seed)
         if self.dimensions == 1:
             self.path = os.path.join(MONO_DIR, instance)
         else:
             self.path = os.path.join(BI_DIR, instance)
 
-        self.graph, self.original_graph = read_graph(self.path)
+        self.graph = read_graph(self.path, cache=True)
 
         self.order = get_variables_order(self.graph)
-        self.original_order = get_variables_order(self.original_graph)
-        self.heuristic_solver = MiniBucket(self.order, self.original_order, self.minibuckets, vertex_cover_cost,
-                                           debug=False)
-        self.heuristic_solver.build_buckets()
+        # without an i-bound, the largest one fitting the memory budget, deepened while the time allows
+        # buckets reduced on workers threads or processes; the searches keep their default number of
+        # processes unless one is given
+        self.heuristic_solver = MiniBucket(self.order, self.minibuckets, vertex_cover_cost, debug=False,
+                                           memory_budget=memory_budget, workers=workers, executor=executor)
+        parallel = {} if processes is None else {'processes': processes}
+        with metrics.timer('solver.build'):
+            if deepen:
+                self.heuristic_solver.deepen(deepen, cache_dir=CACHE_DIR)
+            else:
+                self.heuristic_solver.build_buckets(cache_dir=CACHE_DIR)
         if search_method == "bb":
-            self.search_solver = BranchAndBound(self.heuristic_solver, len(self.graph))
+            self.search_solver = BranchAndBound(self.heuristic_solver, len(self.graph), time_limit=time_limit,
+                                                node_limit=node_limit, callback=self.write_update)
+        elif search_method == "pbb":
+            self.search_solver = ParallelBranchAndBound(self.heuristic_solver, len(self.graph), time_limit=time_limit,
+                                                        node_limit=node_limit, callback=self.write_update, **parallel)
         elif search_method == "nsga2":
-            self.search_solver = NSGA2(self.order, self.heuristic_solver)
+            self.search_solver = NSGA2(self.order, self.heuristic_solver, **parallel)
+
+    def result_path(self):
+        name = "{}_mbe{}_{}".format(self.search_method, "auto" if self.minibuckets is None else self.minibuckets,
+                                    self.instance)
+        if self.seed is not None:
+            name += "_seed{}".format(self.seed)
+        return os.path.join(MONO if self.dimensions == 1 else BI, name)
+
+    def write_update(self, update):
+        # every front found is on disk as soon as it is found, so killed runs keep their progress
+        self.stream.write(json.dumps(update) + "\n")
+        self.stream.flush()
 
     def run(self):
         print("*" * 20, self.instance, "*" * 20)
         start = time.time()
-        pareto_front = self.search_solver.run()
+        if isinstance(self.search_solver, BranchAndBound):
+            with open(self.result_path() + ".jsonl", 'w') as self.stream:
+                pareto_front = self.search_solver.run()
+            self.stream = None
+        else:
+            pareto_front = self.search_solver.run()
         elapsed_time = time.time() - start
 
-        if self.dimensions == 1:
-            f = open(os.path.join(MONO, "{}_mbe{}_{}".format(self.search_method, self.minibuckets,  self.instance)), 'w')
-        else:
-            f = open(os.path.join(BI, "{}_mbe{}_{}".format(self.search_method, self.minibuckets, self.instance)), 'w')
+        f = open(self.result_path(), 'w')
         f.write(json.dumps({"pareto_front": pareto_front.json_serializable(),
                             "data": str(pareto_front),
-                            "time": round(elapsed_time, 2)}, indent=4))
+                            "time": round(elapsed_time, 2),
+                            "mbe": self.heuristic_solver.max_variables,
+                            "complete": not getattr(self.search_solver, "stopped", False)}, indent=4))
         f.close()
 
-
-# solver = Solver(INSTANCE, MINI_BUCKETS, DIMENSIONS, "bb")
-# solver.run()
-
-
-
-
-
-
-
-
+        # counters of the run next to its front, worker processes keeping their own
+        if self.instrument:
+            metrics.add_time('solver.search', elapsed_time)
+            metrics.set('memo', self.heuristic_solver.memo.stats())
+            metrics.set('visited', getattr(self.search_solver, 'visited', None))
+            metrics.write(self.result_path() + ".stats.json")
+            metrics.enable(False)
+
+        # memoized heuristics are not needed once the search is done
+        self.heuristic_solver.clear_caches()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Solver MO-BB')
+    parser.add_argument("-i", "--instance", help="n10_ep0.5_d2")
+    parser.add_argument("-mbe", "--maxvars", type=int, default=None, help="2, picked from the memory budget if unset")
+    parser.add_argument("--table-memory", type=int, default=1024, help="megabytes of bucket tables")
+    parser.add_argument("--deepen", type=float, default=None, help="seconds to rebuild with larger i-bounds")
+    args = parser.parse_args()
+
+    INSTANCE = args.instance
+    DIMENSIONS = int(args.instance.split("_d")[1])
+    MINI_BUCKETS = args.maxvars
+    MEMORY_BUDGET = None if MINI_BUCKETS else args.table_memory << 20
+
+    # solver = Solver(INSTANCE, MINI_BUCKETS, DIMENSIONS, "bb", memory_budget=MEMORY_BUDGET, deepen=args.deepen)
+    # solver.run()
@@ -0,0 +1,87 @@
+import numpy as np
+
+FIELDS = ('chromosomes', 'costs', 'ranks', 'distances', 'pending')
+
+
+class Population:
+    def __init__(self, nodes_count, dimensions, capacity=0):
+        # one row per individual; a rank of -1 marks individuals that were not sorted yet and pending ones
+        # still need their cost computed
+        self.size = 0
+        self.chromosomes = np.zeros((capacity, nodes_count), dtype=np.uint8)
+        self.costs = np.zeros((capacity, dimensions), dtype=np.float64)
+        self.ranks = np.full(capacity, -1, dtype=np.int64)
+        self.distances = np.zeros(capacity, dtype=np.float64)
+        self.pending = np.zeros(capacity, dtype=bool)
+
+    def __len__(self):
+        return self.size
+
+    def add(self, chromosome, cost=None, rank=-1, distance=0):
+        if self.size == len(self.chromosomes):
+            self._grow()
+        self.chromosomes[self.size] = chromosome
+        self.costs[self.size] = np.nan if cost is None else cost
+        self.ranks[self.size] = rank
+        self.distances[self.size] = distance
+        self.pending[self.size] = cost is None
+        self.size += 1
+        return self.size - 1
+
+    def add_from(self, other, index):
+        new_index = self.add(other.chromosomes[index], other.costs[index], other.ranks[index], other.distances[index])
+        self.pending[new_index] = other.pending[index]
+        return new_index
+
+    def _grow(self):
+        capacity = max(1, 2 * len(self.chromosomes))
+        for field in FIELDS:
+            current = getattr(self, field)
+            grown = np.zeros((capacity,) + current.shape[1:], dtype=current.dtype)
+            grown[:self.size] = current[:self.size]
+            setattr(self, field, grown)
+
+    def remove(self, index):
+        # shift the following individuals to keep the population order
+        for field in FIELDS:
+            current = getattr(self, field)
+            current[index:self.size - 1] = current[index + 1:self.size]
+        self.size -= 1
+
+    def find(self, index):
+        # first individual equal to the given one, unsorted individuals having no rank and distance
+        chromosomes, costs = self.chromosomes[:self.size], self.costs[:self.size]
+        equal = (chromosomes == chromosomes[index]).all(axis=1) & (costs == costs[index]).all(axis=1)
+        equal &= self.ranks[:self.size] == self.ranks[index]
+        if self.ranks[index] != -1:
+            distances = self.distances[:self.size]
+            equal &= (distances == distances[index]) | (np.isnan(distances) & np.isnan(distances[index]))
+        return int(np.argmax(equal))
+
+    def take(self, indexes):
+        indexes = np.asarray(indexes, dtype=np.int64)
+        population = Population(self.chromosomes.shape[1], self.costs.shape[1])
+        for field in FIELDS:
+            setattr(population, field, getattr(self, field)[indexes])
+        population.size = len(indexes)
+        return population
+
+    def copy(self):
+        return self.take(np.arange(self.size))
+
+    def concatenate(self, other):
+        population = Population(self.chromosomes.shape[1], self.costs.shape[1])
+        for field in FIELDS:
+            setattr(population, field, np.concatenate((getattr(self, field)[:self.size],
+                                                       getattr(other, field)[:other.size])))
+        population.size = self.size + other.size
+        return population
+
+    def unevaluated(self):
+        return np.flatnonzero(self.pending[:self.size])
+
+    def chromosome(self, index):
+        return self.chromosomes[index].tolist()
+
+    def cost(self, index):
+        return tuple(self.costs[index].tolist())
@@ -0,0 +1,31 @@
+import os
+import sys
+import subprocess
+
+from utils.graph import read_graph
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+INSTANCE = os.path.join(ROOT, 'instances', 'bi-objective', 'n30_ep0.5_d2')
+
+# neighbors of every node in iteration order, printed by a fresh interpreter
+NEIGHBORS = '''
+from utils.graph import read_graph
+graph = read_graph({!r})
+for node in graph:
+    print(node.id, ' '.join(neighbor.id for neighbor in node.neighbors))
+'''.format(INSTANCE)
+
+
+def neighbors_in_process(hash_seed):
+    environment = dict(os.environ, PYTHONHASHSEED=str(hash_seed))
+    return subprocess.check_output([sys.executable, '-c', NEIGHBORS], cwd=ROOT, env=environment,
+                                   universal_newlines=True)
+
+
+def test_nodes_hash_by_index():
+    graph = read_graph(INSTANCE)
+    assert [hash(node) for node in graph] == list(range(len(graph)))
+
+
+def test_neighbor_order_is_the_same_in_every_process():
+    assert neighbors_in_process(1) == neighbors_in_process(2) == neighbors_in_process(3)
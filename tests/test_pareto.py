@@ -0,0 +1,90 @@
+import random
+
+import numpy as np
+import pytest
+
+from utils import pareto
+from utils.pareto import DominanceIndex, non_dominated, ranks
+
+CASES = 300
+
+
+def random_points(generator, dimensions, count):
+    # small integer values so equal points and ties on single objectives are frequent
+    high = generator.choice((3, 10, 100))
+    return [tuple(float(generator.randrange(high)) for _ in range(dimensions)) for _ in range(count)]
+
+
+def random_groups(generator, count):
+    # group sizes adding up to count, empty groups and groups past SMALL_GROUP included
+    if generator.random() < 0.5:
+        return [count]
+    sizes = []
+    while count:
+        size = min(count, generator.choice((0, 1, 2, 5, count)))
+        sizes.append(size)
+        count -= size
+    return sizes
+
+
+def dominates(first, second):
+    return first != second and all(x <= y for x, y in zip(first, second))
+
+
+def brute_force(points, sizes, strict):
+    keep, start = [], 0
+    for size in sizes:
+        group = points[start:start + size]
+        for row, point in enumerate(group):
+            # without strict dominance only the first of equal points is kept
+            keep.append(not any(dominates(other, point) or not strict and other == point and index < row
+                                for index, other in enumerate(group)))
+        start += size
+    return keep
+
+
+def brute_force_ranks(points):
+    # peel the non-dominated points off one front at a time
+    result, left, rank = [None] * len(points), set(range(len(points))), 0
+    while left:
+        front = [row for row in left if not any(dominates(points[other], points[row]) for other in left)]
+        for row in front:
+            result[row] = rank
+        left -= set(front)
+        rank += 1
+    return result
+
+
+@pytest.mark.parametrize('method', ['sweep', 'block', 'small blocks'])
+@pytest.mark.parametrize('strict', [False, True])
+def test_non_dominated_matches_brute_force(method, strict, monkeypatch):
+    # small blocks split every group over several blocks and the grouped pairs over several rounds
+    if method == 'small blocks':
+        monkeypatch.setattr(pareto, 'BLOCK_SIZE', 97)
+        method = 'block'
+    generator = random.Random(method + str(strict))
+    for _ in range(CASES):
+        dimensions = 2 if method == 'sweep' else generator.randint(2, 4)
+        points = random_points(generator, dimensions, generator.randint(0, 80))
+        sizes = random_groups(generator, len(points))
+        offsets = np.concatenate(([0], np.cumsum(sizes))).astype(np.int64)
+        keep = non_dominated(np.array(points).reshape(-1, dimensions), offsets, strict=strict, method=method)
+        assert keep.tolist() == brute_force(points, sizes, strict), (points, sizes)
+
+
+def test_ranks_match_brute_force():
+    generator = random.Random(0)
+    for _ in range(CASES):
+        dimensions = generator.randint(2, 4)
+        points = random_points(generator, dimensions, generator.randint(1, 80))
+        assert ranks(points).tolist() == brute_force_ranks(points), points
+
+
+def test_dominance_index_matches_brute_force():
+    generator = random.Random(0)
+    for _ in range(CASES):
+        dimensions = generator.randint(2, 4)
+        index = DominanceIndex(random_points(generator, dimensions, generator.randint(0, 80)))
+        for vector in random_points(generator, dimensions, 20):
+            assert index.dominated(vector) == any(all(x <= y for x, y in zip(point, vector))
+                                                  for point in index.points), (index.points, vector)
@@ -1,10 +1,19 @@
-from utils.vector import Vector
+import os
+from math import inf
+
+import numpy as np
+
+from utils.result_set import ResultSet
+from utils.vector import Vector, Weights
+
+GRAPH_CACHE_SUFFIX = '.graph.npz'
 
 
 class Node:
-    def __init__(self, node_id, cost):
+    def __init__(self, node_id, cost, index=None):
         self.id = node_id
         self.cost = cost
+        self.index = index
         self.neighbors = set()
 
     def __str__(self):
@@ -18,6 +27,10 @@ class Node:
             raise TypeError('can only compare another node to node')
         return (self.id, self.cost) < (other.id, other.cost)
 
+    def __hash__(self):
+        # by index rather than identity so sets of nodes iterate in the same order in every run
+        return self.index if self.index is not None else super(Node, self).__hash__()
+
     def __len__(self):
         return len(self.neighbors)
 
@@ -27,16 +40,25 @@ class Node:
     def add_neighbor(self, node):
         self.neighbors.add(node)
 
-    def split(self, pieces):
-        self.cost = self.cost / pieces
-
     def json_serializable(self):
         return self.id
 
 
+def vertex_cover_cost(first_node, second_node):
+    # cost function of an edge, at least one of its nodes being in the cover
+    return {
+        'headers': [first_node, second_node],
+        0: ResultSet((Vector(*(inf for _ in range(len(first_node.cost)))),)),
+        1: ResultSet((first_node.cost,)),
+        2: ResultSet((second_node.cost,)),
+        3: ResultSet((first_node.cost + second_node.cost,)),
+    }
+
+
 class Graph:
     def __init__(self):
         self.nodes = {}
+        self.weights = Weights()
 
     def __str__(self):
         return str(self.nodes)
@@ -58,39 +80,107 @@ class Graph:
     def add_node(self, node_id, node_cost):
         if node_id in self.nodes:
             return self.nodes[node_id]
-        new_node = Node(node_id, node_cost)
-        node_cost.includes = {new_node}
+        new_node = Node(node_id, None, len(self.nodes))
+        new_node.cost = self.weights.add(new_node, node_cost)
         self.nodes[node_id] = new_node
         return new_node
 
 
-def read_graph(graph_file):
-    # read graph from file
-    graph = Graph()
-    original_graph = Graph()
-    with open(graph_file, 'r') as h:
-        for line in h:
-            line = line.strip()
-            if not line:
-                continue
-
-            line_type, line = line[:2].strip(), line[2:]
-
-            # process new node or new edge
-            if line_type == 'n':
-                node_id, values = line.split(' ', 1)
-                if node_id not in graph:
-                    graph.add_node(node_id, Vector(*list(map(float, values.split()))))
-                    original_graph.add_node(node_id, Vector(*list(map(float, values.split()))))
-            elif line_type == 'e':
-                node_id_1, node_id_2 = line.split()
-
-                node_1, node_2 = graph[node_id_1], graph[node_id_2]
-                node_1.add_neighbor(node_2)
-                node_2.add_neighbor(node_1)
-
-                node_1, node_2 = original_graph[node_id_1], original_graph[node_id_2]
-                node_1.add_neighbor(node_2)
-                node_2.add_neighbor(node_1)
-
-    return graph, original_graph
+class CompactGraph:
+    def __init__(self, ids, costs, offsets, targets):
+        # node ids and (n, d) costs in file order, neighbors of node i being targets[offsets[i]:offsets[i + 1]]
+        # in the order their edges appear in the file
+        self.ids = list(ids)
+        self.costs = costs
+        self.offsets = offsets
+        self.targets = targets
+
+    def __len__(self):
+        return len(self.ids)
+
+    def neighbors(self, position):
+        return self.targets[self.offsets[position]:self.offsets[position + 1]]
+
+    @property
+    def degrees(self):
+        return np.diff(self.offsets)
+
+    def to_graph(self):
+        # object view with the node and neighbor insertion order of the text parser
+        graph = Graph()
+        nodes = [graph.add_node(node_id, Vector(*values)) for node_id, values in zip(self.ids, self.costs.tolist())]
+        targets = self.targets.tolist()
+        for position, node in enumerate(nodes):
+            for target in targets[self.offsets[position]:self.offsets[position + 1]]:
+                node.add_neighbor(nodes[target])
+        return graph
+
+    def save(self, path, source=()):
+        # written to a temporary file and renamed so concurrent readers never see a partial file
+        temporary = '{}.{}.tmp'.format(path, os.getpid())
+        with open(temporary, 'wb') as f:
+            np.savez(f, ids=np.array(self.ids, dtype=str), costs=self.costs, offsets=self.offsets,
+                     targets=self.targets, source=np.array(source, dtype=np.int64))
+        os.replace(temporary, path)
+
+    @staticmethod
+    def load(path):
+        with np.load(path) as data:
+            return CompactGraph(data['ids'].tolist(), data['costs'], data['offsets'], data['targets'])
+
+    @staticmethod
+    def parse(graph_file):
+        ids, positions, costs, edges = [], {}, [], []
+        with open(graph_file, 'r') as h:
+            for line in h:
+                line = line.strip()
+                if not line:
+                    continue
+
+                line_type, line = line[:2].strip(), line[2:]
+                if line_type == 'n':
+                    node_id, values = line.split(' ', 1)
+                    if node_id not in positions:
+                        positions[node_id] = len(ids)
+                        ids.append(node_id)
+                        costs.append(values.split())
+                elif line_type == 'e':
+                    node_id_1, node_id_2 = line.split()
+                    edges.append((positions[node_id_1], positions[node_id_2]))
+
+        costs = np.array(costs, dtype=np.float64).reshape(len(ids), -1)
+        edges = np.array(edges, dtype=np.int64).reshape(-1, 2)
+
+        # both directions of every edge, grouped by source keeping the file order and the first of duplicates
+        sources = edges.ravel()
+        targets = edges[:, ::-1].ravel()
+        _, first = np.unique(sources * len(ids) + targets, return_index=True)
+        first.sort()
+        sources, targets = sources[first], targets[first]
+        grouped = np.argsort(sources, kind='stable')
+        offsets = np.zeros(len(ids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(sources, minlength=len(ids)), out=offsets[1:])
+        return CompactGraph(ids, costs, offsets, targets[grouped])
+
+
+def _source_stamp(graph_file):
+    stat = os.stat(graph_file)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def load_graph(graph_file, cache=False):
+    # parse the text instance once, reusing a binary copy next to it when it is still up to date
+    cache_file = graph_file + GRAPH_CACHE_SUFFIX
+    if cache and os.path.isfile(cache_file):
+        with np.load(cache_file) as data:
+            current = data['source'].tolist() == _source_stamp(graph_file)
+        if current:
+            return CompactGraph.load(cache_file)
+    compact = CompactGraph.parse(graph_file)
+    if cache:
+        compact.save(cache_file, _source_stamp(graph_file))
+    return compact
+
+
+def read_graph(graph_file, cache=False):
+    return load_graph(graph_file, cache).to_graph()
@@ -0,0 +1,77 @@
+import json
+import time
+from contextlib import contextmanager
+
+
+class Metrics:
+    def __init__(self):
+        # hot paths only check enabled, so nothing is recorded or timed while it is off
+        self.enabled = False
+        self.counters = {}
+        self.timings = {}
+        self.histograms = {}
+        self.series = {}
+        self.values = {}
+
+    def enable(self, enabled=True):
+        self.enabled = enabled
+
+    def reset(self):
+        self.counters = {}
+        self.timings = {}
+        self.histograms = {}
+        self.series = {}
+        self.values = {}
+
+    def count(self, name, amount=1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def add_time(self, name, seconds):
+        # number of calls, total and largest time of a timed operation
+        timing = self.timings.get(name)
+        if timing is None:
+            timing = self.timings[name] = [0, 0.0, 0.0]
+        timing[0] += 1
+        timing[1] += seconds
+        timing[2] = max(timing[2], seconds)
+
+    @contextmanager
+    def timer(self, name):
+        if not self.enabled:
+            yield
+            return
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start_time)
+
+    def histogram(self, name, key, amount=1):
+        histogram = self.histograms.setdefault(name, {})
+        histogram[key] = histogram.get(key, 0) + amount
+
+    def append(self, name, value):
+        self.series.setdefault(name, []).append(value)
+
+    def set(self, name, value):
+        self.values[name] = value
+
+    def summary(self):
+        return {
+            'counters': dict(self.counters),
+            'timings': {name: {'calls': calls, 'total': round(total, 6), 'max': round(largest, 6),
+                               'mean': round(total / calls, 9) if calls else 0}
+                        for name, (calls, total, largest) in self.timings.items()},
+            'histograms': {name: {str(key): value for key, value in sorted(histogram.items())}
+                           for name, histogram in self.histograms.items()},
+            'series': dict(self.series),
+            'values': dict(self.values),
+        }
+
+    def write(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.summary(), f, indent=4)
+
+
+# shared by the whole pipeline and inherited by forked workers, whose records stay in the worker
+metrics = Metrics()
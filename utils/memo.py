@@ -0,0 +1,124 @@
+import sys
+from collections import OrderedDict
+
+DEFAULT_BUDGET = 64 << 20
+
+# bytes of the dictionary entry and links kept for every memoized value on top of its key and value
+ENTRY_OVERHEAD = 104
+
+
+def prefix_key(assignment):
+    # compact encoding of a partial assignment, the length telling apart prefixes ending with zeros
+    return len(assignment), sum(1 << count for count, value in enumerate(assignment) if value)
+
+
+def entry_size(key, value, value_size=None):
+    # value_size stands for the bytes of values owning more than their shallow size
+    size = ENTRY_OVERHEAD + sys.getsizeof(key) + (sys.getsizeof(value) if value_size is None else value_size)
+    if isinstance(key, tuple):
+        size += sum(sys.getsizeof(item) for item in key)
+    return size
+
+
+class Memo:
+    def __init__(self, budget=DEFAULT_BUDGET, policy='lru', protected_share=0.8):
+        if policy not in ('lru', 'segmented'):
+            raise ValueError('unknown memo eviction policy: {}'.format(policy))
+        self.budget = budget
+        self.policy = policy
+
+        # least recently used entries first; with the segmented policy new entries start on probation and
+        # move to the protected segment when hit again, which only gets a share of the budget
+        self.probation = OrderedDict()
+        self.protected = OrderedDict()
+        self.protected_budget = budget * protected_share if policy == 'segmented' else 0
+        self.probation_bytes = 0
+        self.protected_bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.probation) + len(self.protected)
+
+    def __contains__(self, key):
+        return key in self.probation or key in self.protected
+
+    @property
+    def size(self):
+        return self.probation_bytes + self.protected_bytes
+
+    def get(self, key, default=None):
+        if key in self.protected:
+            self.protected.move_to_end(key)
+            self.hits += 1
+            return self.protected[key][0]
+        if key in self.probation:
+            self.hits += 1
+            value, size = self.probation[key]
+            if self.policy == 'lru':
+                self.probation.move_to_end(key)
+            else:
+                del self.probation[key]
+                self.probation_bytes -= size
+                self.protected[key] = value, size
+                self.protected_bytes += size
+                self._demote()
+            return value
+        self.misses += 1
+        return default
+
+    def put(self, key, value, value_size=None):
+        if key in self:
+            self._discard(key)
+        size = entry_size(key, value, value_size)
+        if size > self.budget:
+            return value
+        self.probation[key] = value, size
+        self.probation_bytes += size
+        self._evict()
+        return value
+
+    def _discard(self, key):
+        if key in self.protected:
+            self.protected_bytes -= self.protected.pop(key)[1]
+        else:
+            self.probation_bytes -= self.probation.pop(key)[1]
+
+    def _demote(self):
+        # protected entries over their share go back to the most recent end of probation
+        while self.protected_bytes > self.protected_budget:
+            key, (value, size) = self.protected.popitem(last=False)
+            self.protected_bytes -= size
+            self.probation[key] = value, size
+            self.probation_bytes += size
+        self._evict()
+
+    def _evict(self):
+        while self.size > self.budget:
+            segment = self.probation if self.probation else self.protected
+            _, (_, size) = segment.popitem(last=False)
+            if segment is self.probation:
+                self.probation_bytes -= size
+            else:
+                self.protected_bytes -= size
+            self.evictions += 1
+
+    def clear(self):
+        self.probation.clear()
+        self.protected.clear()
+        self.probation_bytes = 0
+        self.protected_bytes = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else 0,
+            'entries': len(self),
+            'bytes': self.size,
+            'budget': self.budget,
+        }
@@ -0,0 +1,184 @@
+import bisect
+import itertools
+
+import numpy as np
+
+BLOCK_SIZE = 1 << 20
+SMALL_GROUP = 64
+
+
+def pairs(left_starts, left_counts, right_starts, right_counts):
+    # all (left row, right row) pairs of each group, left rows varying slowest
+    counts = left_counts * right_counts
+    groups = np.repeat(np.arange(len(counts)), counts)
+    position = np.arange(counts.sum()) - (np.cumsum(counts) - counts)[groups]
+    right_counts = right_counts[groups]
+    return groups, left_starts[groups] + position // right_counts, right_starts[groups] + position % right_counts
+
+
+def non_dominated(points, offsets=None, strict=False, method='auto'):
+    points = np.asarray(points, dtype=np.float64)
+    if offsets is None:
+        offsets = np.array([0, len(points)], dtype=np.int64)
+    if method == 'auto':
+        method = 'sweep' if points.shape[1] == 2 else 'block'
+
+    if method == 'sweep':
+        if points.shape[1] != 2:
+            raise ValueError('sweep filter needs exactly two objectives')
+        return _sweep(points, offsets, strict)
+    elif method == 'block':
+        return _block(points, offsets, strict)
+    raise ValueError('unknown pareto filter method: {}'.format(method))
+
+
+def _sweep(points, offsets, strict):
+    count = len(points)
+    keep = np.ones(count, dtype=bool)
+    if not count:
+        return keep
+
+    # sort by group and objectives, earlier rows first among equal points
+    groups = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+    order = np.lexsort((np.arange(count), points[:, 1], points[:, 0], groups))
+    first, second, groups = points[order, 0], points[order, 1], groups[order]
+
+    # a point survives if its second objective beats every point before it in its group; ranks are
+    # shifted per group so that a single running maximum never crosses group boundaries
+    ranks = np.unique(second, return_inverse=True)[1].ravel()
+    shifted = groups * (count + 1) + (count - ranks)
+    previous = np.empty(count, dtype=shifted.dtype)
+    previous[0] = -1
+    previous[1:] = np.maximum.accumulate(shifted)[:-1]
+    kept = shifted > previous
+
+    # with strict dominance equal points share the fate of the first one
+    if strict:
+        starts = np.ones(count, dtype=bool)
+        starts[1:] = (groups[1:] != groups[:-1]) | (first[1:] != first[:-1]) | (second[1:] != second[:-1])
+        kept = kept[np.flatnonzero(starts)][np.cumsum(starts) - 1]
+
+    keep[order] = kept
+    return keep
+
+
+def _dominated(first, second, rows, others, strict):
+    # first is dominated by second, the earlier of equal points wins when not strict
+    dominated = (second <= first).all(axis=-1)
+    better = (second < first).any(axis=-1)
+    return dominated & (better if strict else better | (others < rows))
+
+
+def _block(points, offsets, strict):
+    keep = np.ones(len(points), dtype=bool)
+    starts, counts = offsets[:-1], np.diff(offsets)
+
+    # small groups compare all their pairs, as many groups at once as fit in a block
+    small = np.flatnonzero(counts <= SMALL_GROUP)
+    total = np.cumsum(counts[small] ** 2)
+    begin = 0
+    while begin < len(small):
+        done = total[begin - 1] if begin else 0
+        end = max(begin + 1, int(np.searchsorted(total, done + BLOCK_SIZE, side='right')))
+        chosen = small[begin:end]
+        _, rows, others = pairs(starts[chosen], counts[chosen], starts[chosen], counts[chosen])
+        dominated = _dominated(points[rows], points[others], rows, others, strict)
+        keep[rows[dominated]] = False
+        begin = end
+
+    for group in np.flatnonzero(counts > SMALL_GROUP):
+        _block_group(points, starts[group], counts[group], strict, keep)
+    return keep
+
+
+def _block_group(points, start, count, strict, keep):
+    # in lexicographic order every point comes after the points dominating it
+    group = points[start:start + count]
+    order = np.lexsort((np.arange(count),) + tuple(group[:, column] for column in reversed(range(group.shape[1]))))
+    group = group[order]
+
+    # compare blocks of rows against the front found so far and the block itself
+    front = np.empty(0, dtype=np.int64)
+    step = max(1, BLOCK_SIZE // count)
+    for first in range(0, count, step):
+        rows = np.arange(first, min(first + step, count))
+        others = np.concatenate((front, rows))
+        dominated = _dominated(group[rows, None], group[None, others], rows[:, None], others[None], strict)
+        front = np.concatenate((front, rows[~dominated.any(axis=1)]))
+
+    kept = np.zeros(count, dtype=bool)
+    kept[front] = True
+    keep[start + order] = kept
+
+
+def ranks(points):
+    # non-domination rank of every point, equal points never dominating each other
+    points = np.asarray(points, dtype=np.float64)
+    if points.shape[1] == 2:
+        return _ranks_sweep(points)
+    return _ranks_sequential(points)
+
+
+def _ranks_sweep(points):
+    # in lexicographic order a point only has to be compared with the last point added to every front,
+    # whose second objectives grow with the front rank
+    ranks = np.zeros(len(points), dtype=np.int64)
+    tails, tail_points = [], []
+    for row in np.lexsort((points[:, 1], points[:, 0])).tolist():
+        first, second = points[row].tolist()
+        rank = bisect.bisect_right(tails, second)
+        if rank and tail_points[rank - 1] == (first, second):
+            rank -= 1
+        if rank == len(tails):
+            tails.append(second)
+            tail_points.append((first, second))
+        else:
+            tails[rank] = second
+            tail_points[rank] = (first, second)
+        ranks[row] = rank
+    return ranks
+
+
+def _ranks_sequential(points):
+    # efficient non-dominated sort: in lexicographic order a point joins the first front with no point
+    # dominating it, earlier points being the only ones that can dominate it
+    ranks = np.zeros(len(points), dtype=np.int64)
+    fronts = []
+    order = np.lexsort(tuple(points[:, column] for column in reversed(range(points.shape[1]))))
+    for row in order.tolist():
+        point = points[row]
+        rank = 0
+        while rank < len(fronts):
+            front = points[fronts[rank]]
+            if not ((front <= point).all(axis=1) & (front < point).any(axis=1)).any():
+                break
+            rank += 1
+        if rank == len(fronts):
+            fronts.append([])
+        fronts[rank].append(row)
+        ranks[row] = rank
+    return ranks
+
+
+class DominanceIndex:
+    # points of a front answering whether a vector is weakly dominated by one of them; with two objectives
+    # the points are sorted on the first one with the running minimum of the second, so a query is a
+    # binary search, other dimensions scan the points
+    def __init__(self, points=()):
+        self.points = sorted(set(tuple(point) for point in points))
+        self.firsts = self.seconds = None
+        if self.points and len(self.points[0]) == 2:
+            self.firsts = [point[0] for point in self.points]
+            self.seconds = list(itertools.accumulate((point[1] for point in self.points), min))
+
+    def __len__(self):
+        return len(self.points)
+
+    def dominated(self, vector):
+        if self.firsts is not None:
+            position = bisect.bisect_right(self.firsts, vector[0])
+            return position > 0 and self.seconds[position - 1] <= vector[1]
+        return any(all(x <= y for x, y in zip(point, vector)) for point in self.points)
+
+    def all_dominated(self, vectors):
+        return all(self.dominated(vector) for vector in vectors)
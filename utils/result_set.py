@@ -1,6 +1,10 @@
 import operator
 from math import inf
 
+import numpy as np
+
+from utils.pareto import non_dominated
+
 COMPARE_OPERATORS = {
     '<': operator.lt,
     '<=': operator.le,
@@ -8,11 +12,23 @@ COMPARE_OPERATORS = {
     '>=': operator.ge,
 }
 
+# strict dominance and sign of the objectives for every compare operator
+PARETO_ORDERS = {
+    operator.lt: (True, 1),
+    operator.le: (False, 1),
+    operator.gt: (True, -1),
+    operator.ge: (False, -1),
+}
+
+# below this size the pairwise loop beats building a cost matrix
+PAIRWISE_LIMIT = 8
+
 
 class ResultSet(set):
-    def __init__(self, *args, compare='<=', **kwargs):
+    def __init__(self, *args, compare='<=', pareto='auto', **kwargs):
         super(ResultSet, self).__init__(*args, **kwargs)
         self.compare = compare if callable(compare) else COMPARE_OPERATORS[compare]
+        self.pareto = pareto
 
     def __add__(self, other):
         new_items = set()
@@ -63,7 +79,7 @@ class ResultSet(set):
         return self
 
     def __or__(self, other):
-        to_return = ResultSet(super(ResultSet, self).__or__(other))
+        to_return = ResultSet(super(ResultSet, self).__or__(other), compare=self.compare, pareto=self.pareto)
         to_return.remove_dominated()
         return to_return
 
@@ -117,8 +133,8 @@ class ResultSet(set):
         for first_count, first_item in enumerate(contents):
             for second_item in contents[first_count + 1:]:
                 try:
-                    first_len = len(first_item.includes)
-                    second_len = len(second_item.includes)
+                    first_len = bin(first_item.mask).count('1')
+                    second_len = bin(second_item.mask).count('1')
                     if first_len < second_len:
                         self.remove(second_item)
                     elif first_len > second_len:
@@ -127,16 +143,39 @@ class ResultSet(set):
                     pass
 
     def remove_dominated(self):
+        if len(self) < 2:
+            return
+        method = self.pareto
+        if method == 'auto' and len(self) < PAIRWISE_LIMIT:
+            method = 'pairwise'
+        if method == 'pairwise' or self.compare not in PARETO_ORDERS:
+            return self._remove_dominated_pairwise()
+
+        # filter the cost matrix of all vectors at once
+        contents = list(self)
+        strict, sign = PARETO_ORDERS[self.compare]
+        try:
+            points = sign * np.array(contents, dtype=np.float64)
+        except ValueError:
+            return self._remove_dominated_pairwise()
+        keep = non_dominated(points, strict=strict, method=method)
+        for item, kept in zip(contents, keep):
+            if not kept:
+                self.remove(item)
+
+    def _remove_dominated_pairwise(self):
         contents = list(self)
+        dominated = [False] * len(contents)
         for first_count, first_item in enumerate(contents):
-            for second_item in contents[first_count + 1:]:
-                try:
-                    if self.compare(first_item, second_item):
-                        self.remove(second_item)
-                    elif self.compare(second_item, first_item):
-                        self.remove(first_item)
-                except KeyError:
-                    pass
+            for second_count in range(first_count + 1, len(contents)):
+                second_item = contents[second_count]
+                if self.compare(first_item, second_item):
+                    dominated[second_count] = True
+                elif self.compare(second_item, first_item):
+                    dominated[first_count] = True
+        for item, is_dominated in zip(contents, dominated):
+            if is_dominated:
+                self.remove(item)
 
     def json_serializable(self):
         return list(self)
@@ -1,15 +1,25 @@
 import numbers
 from math import inf
 
+# masks whose summed costs are remembered by a weights object
+COST_CACHE_SIZE = 1 << 16
+
 
 class Vector(tuple):
-    def __new__(cls, *args, includes=None):
+    def __new__(cls, *args, mask=0, weights=None):
         result = super(Vector, cls).__new__(cls, args)
-        if not includes:
-            includes = set()
-        setattr(result, 'includes', includes)
+
+        # bit i of mask is set when the node with index i in weights is included
+        result.mask = mask
+        result.weights = weights
         return result
 
+    @property
+    def includes(self):
+        if self.weights is None:
+            return set()
+        return {self.weights.nodes[index] for index in Weights.indexes(self.mask)}
+
     def __str__(self):
         return '({}, includes={})'.format(', '.join(map(str, self)), ','.join(
             map(str, sorted(int(item.id) if item.id.isnumeric() else item.id for item in self.includes))) or '<None>')
@@ -21,18 +31,17 @@ class Vector(tuple):
             raise TypeError('cannot add vector of different size')
 
         if self[0] == inf or other[0] == inf:
-            new_includes = set()
-            new_values = (inf for _ in range(len(self)))
-        else:
-            new_includes = self.includes | other.includes
-            new_values = [sum(x) for x in zip(*(node.cost for node in new_includes))]
+            return Vector(*(inf for _ in range(len(self))))
 
-        return Vector(*new_values, includes=new_includes)
+        weights = self.weights or other.weights
+        if weights is None:
+            return Vector(*(0 for _ in range(len(self))))
+        return weights.join(self, other)
 
     def __truediv__(self, other):
         if not isinstance(other, numbers.Number):
             raise TypeError('can only divide by a number')
-        return Vector(*(x / other for x in self), includes=self.includes)
+        return Vector(*(x / other for x in self), mask=self.mask, weights=self.weights)
 
     def __eq__(self, other):
         if not isinstance(other, Vector) and not isinstance(other, tuple):
@@ -65,18 +74,80 @@ class Vector(tuple):
         return all(x >= y for x, y in zip(self, other))
 
     def __hash__(self):
-        return super(Vector, self).__hash__() + tuple(sorted(self.includes)).__hash__()
+        return hash((super(Vector, self).__hash__(), self.mask))
 
     @staticmethod
     def add_vectors(*vectors, dimensions=None):
         if not vectors:
-            new_includes = set()
-            new_values = (0 for _ in range(dimensions))
+            return Vector(*(0 for _ in range(dimensions)))
         elif any(v[0] == inf for v in vectors):
-            new_includes = set()
-            new_values = (inf for _ in range(len(vectors[0])))
-        else:
-            new_includes = set.union(*(v.includes for v in vectors))
-            new_values = [sum(x) for x in zip(*(node.cost for node in new_includes))]
+            return Vector(*(inf for _ in range(len(vectors[0]))))
+
+        weights = next((v.weights for v in vectors if v.weights is not None), None)
+        if weights is None:
+            return Vector(*(0 for _ in range(len(vectors[0]))))
+        mask = 0
+        for vector in vectors:
+            mask |= vector.mask
+        return weights.vector(mask)
+
+
+class Weights:
+    def __init__(self):
+        # nodes and their current costs by node index
+        self.nodes = []
+        self.costs = []
+        self.version = 0
+
+        # summed costs of the masks seen, valid while the costs list and version they were summed from
+        # are the current ones
+        self._sums = {}
+        self._sums_key = None
+
+    def copy(self):
+        # same nodes with costs that can be split independently
+        weights = Weights()
+        weights.nodes = self.nodes
+        weights.costs = list(self.costs)
+        weights.version = self.version
+        return weights
+
+    def add(self, node, values):
+        self.nodes.append(node)
+        self.costs.append(tuple(values))
+        return self.vector(1 << (len(self.nodes) - 1))
+
+    def split(self, index, pieces):
+        self.costs[index] = tuple(value / pieces for value in self.costs[index])
+        self.version += 1
+        return self.vector(1 << index)
+
+    def vector(self, mask):
+        return Vector(*self.cost(mask), mask=mask, weights=self)
+
+    def cost(self, mask):
+        # summed in node index order, so a mask always gets the same values however it was built
+        if self._sums_key is None or self._sums_key[0] is not self.costs or self._sums_key[1] != self.version:
+            self._sums = {}
+            self._sums_key = self.costs, self.version
+        values = self._sums.get(mask)
+        if values is None:
+            values = [0] * len(self.costs[0])
+            for index in self.indexes(mask):
+                values = [x + y for x, y in zip(values, self.costs[index])]
+            if len(self._sums) >= COST_CACHE_SIZE:
+                self._sums = {}
+            self._sums[mask] = values
+        return values
+
+    def join(self, first, second):
+        # recomputed from the joined includes rather than added to either operand, whose values depend on
+        # the order they were built in
+        return self.vector(first.mask | second.mask)
 
-        return Vector(*new_values, includes=new_includes)
+    @staticmethod
+    def indexes(mask):
+        while mask:
+            low = mask & -mask
+            yield low.bit_length() - 1
+            mask ^= low